@@ -0,0 +1,39 @@
+"""Add trigram index on expense merchant
+
+Revision ID: 8c1d2e4f6a7b
+Revises: f3677ed61015
+Create Date: 2026-10-15 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d2e4f6a7b'
+down_revision: Union[str, Sequence[str], None] = 'f3677ed61015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_expenses_merchant_trgm',
+        'expenses',
+        ['merchant'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'merchant': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_expenses_merchant_trgm',
+        table_name='expenses',
+        postgresql_using='gin',
+    )
@@ -0,0 +1,27 @@
+"""Add composite user/category index on expenses
+
+Revision ID: a3f8d1e7c925
+Revises: e2c9b6a1f4d8
+Create Date: 2026-10-15 15:41:09.518374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f8d1e7c925'
+down_revision: Union[str, Sequence[str], None] = 'e2c9b6a1f4d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_expenses_user_category', 'expenses', ['user_id', 'category'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expenses_user_category', table_name='expenses')
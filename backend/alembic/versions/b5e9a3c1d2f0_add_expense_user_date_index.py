@@ -0,0 +1,33 @@
+"""Add composite user/date index on expenses
+
+Revision ID: b5e9a3c1d2f0
+Revises: 8c1d2e4f6a7b
+Create Date: 2026-10-15 09:48:05.772913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e9a3c1d2f0'
+down_revision: Union[str, Sequence[str], None] = '8c1d2e4f6a7b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_expenses_user_date',
+        'expenses',
+        ['user_id', 'date'],
+        unique=False,
+        postgresql_include=['amount', 'category'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expenses_user_date', table_name='expenses')
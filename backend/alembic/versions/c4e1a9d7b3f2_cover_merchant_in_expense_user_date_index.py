@@ -0,0 +1,43 @@
+"""Cover merchant in the user/date index on expenses
+
+Revision ID: c4e1a9d7b3f2
+Revises: a3f8d1e7c925
+Create Date: 2026-10-15 22:16:42.205113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e1a9d7b3f2'
+down_revision: Union[str, Sequence[str], None] = 'a3f8d1e7c925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def replace_user_date_index(include: list) -> None:
+    # Build the replacement alongside the old index so range scans stay
+    # indexed throughout; CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_expenses_user_date_new',
+            'expenses',
+            ['user_id', 'date'],
+            unique=False,
+            postgresql_include=include,
+            postgresql_concurrently=True,
+        )
+        op.drop_index('ix_expenses_user_date', table_name='expenses', postgresql_concurrently=True)
+        op.execute('ALTER INDEX ix_expenses_user_date_new RENAME TO ix_expenses_user_date')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    replace_user_date_index(['amount', 'category', 'merchant'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    replace_user_date_index(['amount', 'category'])
@@ -0,0 +1,44 @@
+"""Add monthly expense aggregate materialized view
+
+Revision ID: d7a4f2b8c3e1
+Revises: b5e9a3c1d2f0
+Create Date: 2026-10-15 14:12:37.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a4f2b8c3e1'
+down_revision: Union[str, Sequence[str], None] = 'b5e9a3c1d2f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE MATERIALIZED VIEW mv_expense_monthly AS
+        SELECT user_id,
+               date_trunc('month', date) AS month,
+               coalesce(category, 'OTHER') AS category,
+               sum(amount) AS total,
+               count(*)::integer AS count,
+               max(coalesce(updated_at, created_at)) AS last_modified
+        FROM expenses
+        GROUP BY 1, 2, 3
+    """)
+    # REFRESH ... CONCURRENTLY requires a unique index
+    op.create_index(
+        'ix_mv_expense_monthly_user_month_category',
+        'mv_expense_monthly',
+        ['user_id', 'month', 'category'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW mv_expense_monthly")
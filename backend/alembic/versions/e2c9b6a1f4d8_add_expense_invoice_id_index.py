@@ -0,0 +1,27 @@
+"""Add index on expenses.invoice_id
+
+Revision ID: e2c9b6a1f4d8
+Revises: d7a4f2b8c3e1
+Create Date: 2026-10-15 15:03:41.226590
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c9b6a1f4d8'
+down_revision: Union[str, Sequence[str], None] = 'd7a4f2b8c3e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_expenses_invoice_id', 'expenses', ['invoice_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expenses_invoice_id', table_name='expenses')
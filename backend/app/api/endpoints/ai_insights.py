@@ -1,15 +1,133 @@
 from typing import Any, List, Optional
+import hashlib
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from app.api.deps import get_current_active_user, get_db
+from app.api.deps import get_current_active_user, get_async_db, get_request_now
 from app.models.user import User
-from app.models.expense import Expense
+from app.models.expense import Expense, ExpenseCategory
+from app.models.expense_monthly import expense_monthly
 from app.core.ai_client import ai_client
+from app.core.cache import cache
+from app.core.config import settings
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Uncategorized expenses are reported as "other"
+category_or_other = func.coalesce(
+    Expense.category, literal(ExpenseCategory.OTHER, Expense.category.type)
+)
+
+
+# Latest modification time and row count of a user's expenses
+signature_columns = (
+    func.max(func.coalesce(Expense.updated_at, Expense.created_at)),
+    func.count(Expense.id),
+)
+
+# Statements are built once at import; per-request values are bound at execution
+user_filter = Expense.user_id == bindparam('user_id')
+period_filter = Expense.date.between(bindparam('start_date'), bindparam('end_date'))
+
+signature_stmt = select(*signature_columns).where(user_filter)
+
+period_count_stmt = select(func.count(Expense.id)).where(user_filter, period_filter)
+
+# Only the columns sent to the AI, as plain rows instead of ORM objects
+analysis_rows_stmt = select(
+    Expense.date,
+    Expense.merchant,
+    Expense.amount,
+    Expense.category,
+    Expense.ai_category
+).where(user_filter, period_filter)
+
+monthly_totals_stmt = (
+    select(expense_monthly)
+    .where(expense_monthly.c.user_id == bindparam('user_id'))
+    .order_by(expense_monthly.c.month)
+)
+
+# Top categories plus overall totals (window sums run before the LIMIT)
+category_total = func.sum(Expense.amount)
+top_categories_stmt = (
+    select(
+        category_or_other.label('category'),
+        category_total.label('amount'),
+        func.sum(category_total).over().label('total'),
+        func.sum(func.count(Expense.id)).over().label('count')
+    )
+    .where(user_filter, period_filter)
+    .group_by(category_or_other)
+    .order_by(category_total.desc())
+    .limit(3)
+)
+
+# A merchant's history aggregated per category, most frequent first
+merchant_categories_stmt = (
+    select(
+        category_or_other,
+        func.count(Expense.id),
+        func.sum(Expense.amount)
+    )
+    .where(user_filter, Expense.merchant.ilike(bindparam('pattern')))
+    .group_by(category_or_other)
+    .order_by(func.count(Expense.id).desc())
+)
+
+
+def hash_signature(last_modified: Optional[datetime], count: int) -> str:
+    return hashlib.blake2b(f"{last_modified}:{count}".encode(), digest_size=16).hexdigest()
+
+
+async def get_expense_signature(db: AsyncSession, user_id: int) -> str:
+    """Fingerprint of a user's expenses that changes whenever they do"""
+    last_modified, count = (await db.execute(
+        signature_stmt, {"user_id": user_id}
+    )).one()
+    
+    return hash_signature(last_modified, count)
+
+
+async def get_monthly_totals(db: AsyncSession, user_id: int) -> List[Any]:
+    """All of a user's monthly category totals, in month order"""
+    result = await db.execute(monthly_totals_stmt, {"user_id": user_id})
+    return result.all()
+
+
+async def build_chat_context(db: AsyncSession, user_id: int, now: datetime) -> Optional[dict]:
+    """Last 30 days' spending summary, cached briefly since chats come in bursts"""
+    cache_key = f"ai:chat-context:{user_id}"
+    context = await cache.get_json(cache_key)
+    if context is not None:
+        return context or None
+    
+    end_date = now
+    start_date = end_date - timedelta(days=30)
+    
+    top_categories = (await db.execute(
+        top_categories_stmt,
+        {"user_id": user_id, "start_date": start_date, "end_date": end_date}
+    )).all()
+    
+    context = {}
+    if top_categories:
+        total_spent = top_categories[0].total
+        context = {
+            "total_spent_30d": total_spent,
+            "transaction_count": int(top_categories[0].count),
+            "daily_average": total_spent / 30,
+            "top_categories": [
+                (row.category.value, row.amount) for row in top_categories
+            ]
+        }
+    
+    # An empty dict marks "no recent spending" so that is cached too
+    await cache.set_json(cache_key, context, settings.AI_CHAT_CONTEXT_TTL_SECONDS)
+    return context or None
+
 
 class InsightRequest(BaseModel):
     timeframe_days: int = 30
@@ -41,46 +159,65 @@ class PredictionResponse(BaseModel):
 @router.post("/analyze", response_model=InsightResponse)
 async def analyze_spending(
     request: InsightRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
 ) -> Any:
     """Get AI-powered spending insights"""
     # Get expenses for the timeframe
-    end_date = datetime.now()
+    end_date = now
     start_date = end_date - timedelta(days=request.timeframe_days)
+    timeframe = {
+        "start": start_date,
+        "end": end_date,
+        "days": request.timeframe_days
+    }
+    
+    # Reuse today's insights for this window while the user's expenses are unchanged
+    signature = await get_expense_signature(db, current_user.id)
+    cache_key = f"ai:analyze:{current_user.id}:{request.timeframe_days}:{end_date.strftime('%Y-%m-%d')}:{signature}"
+    cached = await cache.get_json(cache_key)
+    if cached is not None:
+        return {
+            "insights": cached["insights"],
+            "generated_at": cached["generated_at"],
+            "timeframe": timeframe
+        }
     
-    expenses = db.query(Expense).filter(
-        Expense.user_id == current_user.id,
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    ).all()
+    rows = (await db.execute(
+        analysis_rows_stmt,
+        {"user_id": current_user.id, "start_date": start_date, "end_date": end_date}
+    )).all()
     
-    if not expenses:
+    if not rows:
         raise HTTPException(status_code=404, detail="No expenses found for the specified timeframe")
     
     # Prepare data for AI analysis
-    expense_data = []
-    for expense in expenses:
-        expense_data.append({
-            "date": expense.date.isoformat(),
-            "merchant": expense.merchant,
-            "amount": expense.amount,
-            "category": expense.category.value if expense.category else "other",
-            "ai_category": expense.ai_category.value if expense.ai_category else None
-        })
+    expense_data = [
+        {
+            "date": date.isoformat(),
+            "merchant": merchant,
+            "amount": amount,
+            "category": category.value if category else "other",
+            "ai_category": ai_category.value if ai_category else None
+        }
+        for date, merchant, amount, category, ai_category in rows
+    ]
     
     # Get AI insights
     try:
         insights = await ai_client.analyze_spending_patterns(expense_data)
+        if "error" not in insights:
+            await cache.set_json(
+                cache_key,
+                {"insights": insights, "generated_at": now.isoformat()},
+                settings.AI_CACHE_TTL_SECONDS
+            )
         
         return {
             "insights": insights,
-            "generated_at": datetime.now(),
-            "timeframe": {
-                "start": start_date.isoformat(),
-                "end": end_date.isoformat(),
-                "days": request.timeframe_days
-            }
+            "generated_at": now,
+            "timeframe": timeframe
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
@@ -89,67 +226,83 @@ async def analyze_spending(
 @router.post("/predict", response_model=PredictionResponse)
 async def predict_expenses(
     months_ahead: int = 1,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
 ) -> Any:
     """Predict future expenses using AI"""
     # Get historical data (last 6 months)
-    end_date = datetime.now()
+    end_date = now
     start_date = end_date - timedelta(days=180)
     
-    expenses = db.query(Expense).filter(
-        Expense.user_id == current_user.id,
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    ).order_by(Expense.date).all()
+    transaction_count = await db.scalar(
+        period_count_stmt,
+        {"user_id": current_user.id, "start_date": start_date, "end_date": end_date}
+    )
     
-    if len(expenses) < 30:
+    if transaction_count < 30:
         raise HTTPException(
             status_code=400, 
             detail="Insufficient historical data. Need at least 30 transactions for predictions."
         )
     
+    # Calculate confidence based on data quality
+    confidence = min(0.95, 0.5 + (transaction_count / 1000))  # Max 95% confidence
+    
+    # Monthly totals per category come from the precomputed view, which is
+    # refreshed in the background after expenses change
+    rows = await get_monthly_totals(db, current_user.id)
+    
+    # Reuse this month's predictions while the view's rows are unchanged
+    signature = hash_signature(
+        max((row.last_modified for row in rows), default=None),
+        sum(row.count for row in rows)
+    )
+    cache_key = f"ai:predict:v2:{current_user.id}:{end_date.strftime('%Y-%m')}:{signature}"
+    cached = await cache.get_json(cache_key)
+    if cached is not None:
+        return {
+            "predictions": cached["predictions"],
+            "confidence": round(confidence, 2),
+            "generated_at": cached["generated_at"]
+        }
+    
     # Prepare historical data
-    historical_data = []
+    first_month, last_month = start_date.strftime('%Y-%m'), end_date.strftime('%Y-%m')
     monthly_totals = {}
-    
-    for expense in expenses:
-        month_key = expense.date.strftime('%Y-%m')
+    for row in rows:
+        month_key = row.month.strftime('%Y-%m')
+        if not first_month <= month_key <= last_month:
+            continue
+        
         if month_key not in monthly_totals:
             monthly_totals[month_key] = {
-                "total": 0,
-                "count": 0,
-                "categories": {}
+                "month": month_key,
+                "total_spent": 0,
+                "transaction_count": 0,
+                "category_breakdown": {}
             }
         
-        monthly_totals[month_key]["total"] += expense.amount
-        monthly_totals[month_key]["count"] += 1
-        
-        category = expense.category.value if expense.category else "other"
-        if category not in monthly_totals[month_key]["categories"]:
-            monthly_totals[month_key]["categories"][category] = 0
-        monthly_totals[month_key]["categories"][category] += expense.amount
+        monthly_totals[month_key]["total_spent"] += row.total
+        monthly_totals[month_key]["transaction_count"] += row.count
+        monthly_totals[month_key]["category_breakdown"][row.category.value] = row.total
     
-    # Convert to list for AI
-    for month, data in sorted(monthly_totals.items()):
-        historical_data.append({
-            "month": month,
-            "total_spent": data["total"],
-            "transaction_count": data["count"],
-            "category_breakdown": data["categories"]
-        })
+    historical_data = list(monthly_totals.values())
     
     # Get AI predictions
     try:
         predictions = await ai_client.predict_future_expenses(historical_data)
-        
-        # Calculate confidence based on data quality
-        confidence = min(0.95, 0.5 + (len(expenses) / 1000))  # Max 95% confidence
+        if "error" not in predictions:
+            await cache.set_json(
+                cache_key,
+                {"predictions": predictions, "generated_at": now.isoformat()},
+                settings.AI_CACHE_TTL_SECONDS
+            )
         
         return {
             "predictions": predictions,
             "confidence": round(confidence, 2),
-            "generated_at": datetime.now()
+            "generated_at": now
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI prediction failed: {str(e)}")
@@ -158,43 +311,12 @@ async def predict_expenses(
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_assistant(
     request: ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
 ) -> Any:
     """Chat with AI financial assistant"""
-    context = None
-    
-    if request.include_context:
-        # Get recent spending summary as context
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-        
-        expenses = db.query(Expense).filter(
-            Expense.user_id == current_user.id,
-            Expense.date >= start_date,
-            Expense.date <= end_date
-        ).all()
-        
-        if expenses:
-            total_spent = sum(e.amount for e in expenses)
-            category_totals = {}
-            
-            for expense in expenses:
-                category = expense.category.value if expense.category else "other"
-                if category not in category_totals:
-                    category_totals[category] = 0
-                category_totals[category] += expense.amount
-            
-            context = {
-                "total_spent_30d": total_spent,
-                "transaction_count": len(expenses),
-                "daily_average": total_spent / 30,
-                "top_categories": sorted(
-                    category_totals.items(), 
-                    key=lambda x: x[1], 
-                    reverse=True
-                )[:3]
-            }
+    context = await build_chat_context(db, current_user.id, now) if request.include_context else None
     
     try:
         response = await ai_client.chat_with_financial_assistant(
@@ -213,17 +335,21 @@ async def chat_with_assistant(
 @router.get("/suggestions/merchants/{merchant}")
 async def get_merchant_suggestions(
     merchant: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get AI suggestions for categorizing a specific merchant"""
-    # Get all expenses from this merchant
-    expenses = db.query(Expense).filter(
-        Expense.user_id == current_user.id,
-        Expense.merchant.ilike(f"%{merchant}%")
-    ).all()
+    # Aggregate this merchant's expenses per category
+    result = await db.execute(
+        merchant_categories_stmt,
+        {"user_id": current_user.id, "pattern": f"%{merchant}%"}
+    )
+    categories = {
+        cat.value: {"count": count, "amount": amount}
+        for cat, count, amount in result
+    }
     
-    if not expenses:
+    if not categories:
         # Try AI categorization without history
         try:
             category = await ai_client.categorize_expense(merchant, 0)
@@ -236,24 +362,8 @@ async def get_merchant_suggestions(
         except:
             raise HTTPException(status_code=404, detail="Could not determine category")
     
-    # Analyze historical categorization
-    categories = {}
-    total_amount = 0
-    
-    for expense in expenses:
-        cat = expense.category.value if expense.category else "other"
-        if cat not in categories:
-            categories[cat] = {"count": 0, "amount": 0}
-        categories[cat]["count"] += 1
-        categories[cat]["amount"] += expense.amount
-        total_amount += expense.amount
-    
-    # Sort by frequency
-    most_common = sorted(
-        categories.items(), 
-        key=lambda x: x[1]["count"], 
-        reverse=True
-    )[0]
+    # Categories are ordered by frequency
+    most_common = next(iter(categories.items()))
     
     return {
         "merchant": merchant,
@@ -261,8 +371,8 @@ async def get_merchant_suggestions(
         "confidence": "high" if most_common[1]["count"] > 5 else "medium",
         "based_on": "historical_data",
         "history": {
-            "total_transactions": len(expenses),
-            "total_amount": total_amount,
+            "total_transactions": sum(c["count"] for c in categories.values()),
+            "total_amount": sum(c["amount"] for c in categories.values()),
             "category_breakdown": categories
         }
     }
\ No newline at end of file
@@ -1,9 +1,13 @@
-from typing import Any, Optional
+from typing import Any, Callable, Optional
+import asyncio
 from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, date, timedelta
-from app.api.deps import get_current_active_user, get_db
+from app.api.deps import get_current_active_user, get_async_db, get_request_now
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.models.user import User
 from app.models.expense import Expense
 from app.services.analytics_engine import AnalyticsEngine
@@ -11,6 +15,14 @@ from pydantic import BaseModel
 
 router = APIRouter()
 
+# Built once at import; the user id is bound per request
+earliest_expense_date_stmt = (
+    select(Expense.date)
+    .where(Expense.user_id == bindparam('user_id'))
+    .order_by(Expense.date.asc())
+    .limit(1)
+)
+
 
 class SpendingSummaryResponse(BaseModel):
     total_spent: float
@@ -37,34 +49,35 @@ class BudgetRecommendationResponse(BaseModel):
 
 
 @router.get("/summary", response_model=SpendingSummaryResponse)
-def get_spending_summary(
+async def get_spending_summary(
     start_date: Optional[date] = Query(None, description="Start date (defaults to 30 days ago)"),
     end_date: Optional[date] = Query(None, description="End date (defaults to today)"),
     all_time: bool = Query(False, description="Get all time data"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
 ) -> Any:
     """Get spending summary for date range"""
     # Handle all time data
     if all_time or (not start_date and not end_date):
         # Get the earliest expense date for this user
-        earliest_expense = db.query(Expense).filter(
-            Expense.user_id == current_user.id
-        ).order_by(Expense.date.asc()).first()
+        earliest_date = await db.scalar(
+            earliest_expense_date_stmt, {"user_id": current_user.id}
+        )
         
-        if earliest_expense:
-            start_datetime = datetime.combine(earliest_expense.date, datetime.min.time())
-            end_datetime = datetime.now()
+        if earliest_date:
+            start_datetime = datetime.combine(earliest_date, datetime.min.time(), tzinfo=now.tzinfo)
+            end_datetime = now
         else:
             # No expenses, use default range
-            end_date = datetime.now().date()
+            end_date = now.date()
             start_date = end_date - timedelta(days=30)
             start_datetime = datetime.combine(start_date, datetime.min.time())
             end_datetime = datetime.combine(end_date, datetime.max.time())
     else:
         # Default date range
         if not end_date:
-            end_date = datetime.now().date()
+            end_date = now.date()
         if not start_date:
             start_date = end_date - timedelta(days=30)
         
@@ -72,86 +85,149 @@ def get_spending_summary(
         start_datetime = datetime.combine(start_date, datetime.min.time())
         end_datetime = datetime.combine(end_date, datetime.max.time())
     
-    analytics = AnalyticsEngine(db)
-    summary = analytics.get_spending_summary(current_user.id, start_datetime, end_datetime)
+    summary = await db.run_sync(
+        lambda session: AnalyticsEngine(session).get_spending_summary(
+            current_user.id, start_datetime, end_datetime
+        )
+    )
     
     return summary
 
 
 @router.get("/trends/monthly")
-def get_monthly_trends(
+async def get_monthly_trends(
     months: int = Query(12, ge=1, le=24, description="Number of months to analyze"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get monthly spending trends"""
-    analytics = AnalyticsEngine(db)
-    trends = analytics.get_monthly_trends(current_user.id, months)
+    trends = await db.run_sync(
+        lambda session: AnalyticsEngine(session).get_monthly_trends(current_user.id, months)
+    )
     return trends
 
 
 @router.get("/trends/category")
-def get_category_trends(
+async def get_category_trends(
     months: int = Query(6, ge=1, le=12, description="Number of months to analyze"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get spending trends by category"""
-    analytics = AnalyticsEngine(db)
-    trends = analytics.get_category_trends(current_user.id, months)
+    trends = await db.run_sync(
+        lambda session: AnalyticsEngine(session).get_category_trends(current_user.id, months)
+    )
     return trends
 
 
 @router.get("/unusual")
-def detect_unusual_spending(
-    db: Session = Depends(get_db),
+async def detect_unusual_spending(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Detect unusual spending patterns"""
-    analytics = AnalyticsEngine(db)
-    unusual = analytics.detect_unusual_spending(current_user.id)
+    unusual = await db.run_sync(
+        lambda session: AnalyticsEngine(session).detect_unusual_spending(current_user.id)
+    )
     return unusual
 
 
 @router.get("/budget/recommendations", response_model=BudgetRecommendationResponse)
-def get_budget_recommendations(
-    db: Session = Depends(get_db),
+async def get_budget_recommendations(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get AI-powered budget recommendations"""
-    analytics = AnalyticsEngine(db)
-    recommendations = analytics.get_budget_recommendations(current_user.id)
+    recommendations = await db.run_sync(
+        lambda session: AnalyticsEngine(session).get_budget_recommendations(current_user.id)
+    )
     return recommendations
 
 
+# Caps the extra connections dashboards hold at once, leaving the rest of
+# the pool to other requests
+analytics_sessions = asyncio.Semaphore(settings.DB_POOL_SIZE // 2)
+
+
+async def run_analytics(method: Callable[[AnalyticsEngine], Any]) -> Any:
+    """Run an AnalyticsEngine method on its own session and connection"""
+    async with analytics_sessions, AsyncSessionLocal() as session:
+        return await session.run_sync(lambda sync_session: method(AnalyticsEngine(sync_session)))
+
+
+@router.get("/dashboard")
+async def get_dashboard(
+    months: int = Query(6, ge=1, le=24, description="Number of months of trends"),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
+) -> Any:
+    """Get the dashboard's summary, trends and unusual spending in one call"""
+    end_datetime = now
+    start_datetime = end_datetime - timedelta(days=30)
+    
+    # Independent queries run concurrently, each on its own connection, so
+    # the response takes as long as the slowest one rather than their sum
+    summary, monthly_trends, category_trends, unusual = await asyncio.gather(
+        run_analytics(lambda engine: engine.get_spending_summary(current_user.id, start_datetime, end_datetime)),
+        run_analytics(lambda engine: engine.get_monthly_trends(current_user.id, months)),
+        run_analytics(lambda engine: engine.get_category_trends(current_user.id, months)),
+        run_analytics(lambda engine: engine.detect_unusual_spending(current_user.id))
+    )
+    
+    return {
+        "summary": summary,
+        "monthly_trends": monthly_trends,
+        "category_trends": category_trends,
+        "unusual_spending": unusual
+    }
+
+
 @router.get("/export")
-def export_data(
+async def export_data(
     format: str = Query("csv", regex="^(csv|json|excel)$"),
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    now: datetime = Depends(get_request_now)
 ) -> Any:
     """Export expense data"""
-    analytics = AnalyticsEngine(db)
-    
     # Convert dates to datetime if provided
     start_datetime = datetime.combine(start_date, datetime.min.time()) if start_date else None
     end_datetime = datetime.combine(end_date, datetime.max.time()) if end_date else None
     
+    if format == "csv":
+        def stream_csv():
+            # The request's session is closed once the handler returns, so
+            # the stream reads through its own session
+            with SessionLocal() as session:
+                yield from AnalyticsEngine(session).iter_csv(
+                    current_user.id, start_datetime, end_datetime
+                )
+        
+        filename = f"expenses_{now.strftime('%Y%m%d')}.csv"
+        return StreamingResponse(
+            stream_csv(),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
+        )
+    
     try:
-        data = analytics.export_data(current_user.id, format, start_datetime, end_datetime)
+        data = await db.run_sync(
+            lambda session: AnalyticsEngine(session).export_data(
+                current_user.id, format, start_datetime, end_datetime
+            )
+        )
         
         # Set appropriate content type and filename
-        if format == "csv":
-            media_type = "text/csv"
-            filename = f"expenses_{datetime.now().strftime('%Y%m%d')}.csv"
-        elif format == "json":
+        if format == "json":
             media_type = "application/json"
-            filename = f"expenses_{datetime.now().strftime('%Y%m%d')}.json"
+            filename = f"expenses_{now.strftime('%Y%m%d')}.json"
         else:  # excel
             media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            filename = f"expenses_{datetime.now().strftime('%Y%m%d')}.xlsx"
+            filename = f"expenses_{now.strftime('%Y%m%d')}.xlsx"
         
         return Response(
             content=data,
@@ -3,13 +3,17 @@ from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
 from app.core import security
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.user import User
 from app.services.google_oauth import google_oauth
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional
 import secrets
 
@@ -30,8 +34,7 @@ class UserResponse(BaseModel):
     full_name: Optional[str]
     is_active: bool
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Token(BaseModel):
@@ -39,46 +42,91 @@ class Token(BaseModel):
     token_type: str
 
 
+async def upsert_google_user(db: AsyncSession, user_info: dict) -> User:
+    """Create the Google user, or link Google to the account with the same email"""
+    stmt = insert(User).values(
+        email=user_info["email"],
+        username=user_info["email"],  # Use email as username for Google users
+        full_name=user_info["name"],
+        google_id=user_info["google_id"],
+        profile_picture=user_info.get("picture"),
+        is_active=True
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.email],
+        set_={
+            "google_id": func.coalesce(User.google_id, stmt.excluded.google_id),
+            "profile_picture": func.coalesce(User.profile_picture, stmt.excluded.profile_picture)
+        }
+    ).returning(User)
+    
+    try:
+        user = (await db.execute(stmt)).scalar_one()
+    except IntegrityError:
+        # Known Google account whose email has changed since it was linked
+        await db.rollback()
+        user = await db.scalar(select(User).where(User.google_id == user_info["google_id"]))
+        if not user:
+            # The conflict was on another account's username or Google ID
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="This Google account conflicts with an existing user"
+            )
+        return user
+    
+    await db.commit()
+    return user
+
+
 @router.post("/register", response_model=UserResponse)
-def register(user_in: UserCreate, db: Session = Depends(get_db)) -> Any:
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)) -> Any:
     """Register new user"""
-    # Check if user exists
-    user = db.query(User).filter(
-        (User.email == user_in.email) | (User.username == user_in.username)
-    ).first()
-    
-    if user:
+    # Reject taken emails and usernames before paying for the password hash
+    existing = await db.scalar(
+        select(User.id).where(or_(User.email == user_in.email, User.username == user_in.username))
+    )
+    if existing:
         raise HTTPException(
             status_code=400,
             detail="User with this email or username already exists"
         )
     
-    # Create new user
-    user = User(
-        email=user_in.email,
-        username=user_in.username,
-        hashed_password=security.get_password_hash(user_in.password),
-        full_name=user_in.full_name,
-        is_active=True
-    )
+    hashed_password = await security.get_password_hash_async(user_in.password)
     
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    # The unique indexes still guard against a concurrent registration
+    user = (await db.execute(
+        insert(User).values(
+            email=user_in.email,
+            username=user_in.username,
+            hashed_password=hashed_password,
+            full_name=user_in.full_name,
+            is_active=True
+        ).on_conflict_do_nothing().returning(User)
+    )).scalar_one_or_none()
+    
+    if not user:
+        raise HTTPException(
+            status_code=400,
+            detail="User with this email or username already exists"
+        )
+    
+    await db.commit()
     
     return user
 
 
 @router.post("/login", response_model=Token)
-def login(
-    db: Session = Depends(get_db),
+async def login(
+    db: AsyncSession = Depends(get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """Login user"""
-    # Try to find user in database
-    user = db.query(User).filter(
-        (User.email == form_data.username) | (User.username == form_data.username)
-    ).first()
+    # Look the user up by email or username, each served by its unique index
+    user = None
+    if "@" in form_data.username:
+        user = await db.scalar(select(User).where(User.email == form_data.username))
+    if not user:
+        user = await db.scalar(select(User).where(User.username == form_data.username))
     
     if not user:
         raise HTTPException(
@@ -95,7 +143,7 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not security.verify_password(form_data.password, user.hashed_password):
+    if not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -122,7 +170,7 @@ def google_login():
 async def google_callback(
     code: str = Query(...),
     state: str = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """Handle Google OAuth callback"""
     try:
@@ -132,32 +180,7 @@ async def google_callback(
         # Verify ID token and get user info
         user_info = await google_oauth.verify_id_token(token_data["id_token"])
         
-        # Check if user exists
-        user = db.query(User).filter(
-            (User.google_id == user_info["google_id"]) | 
-            (User.email == user_info["email"])
-        ).first()
-        
-        if user:
-            # Update existing user with Google info if not already set
-            if not user.google_id:
-                user.google_id = user_info["google_id"]
-                user.profile_picture = user_info.get("picture")
-                db.commit()
-                db.refresh(user)
-        else:
-            # Create new user
-            user = User(
-                email=user_info["email"],
-                username=user_info["email"],  # Use email as username for Google users
-                full_name=user_info["name"],
-                google_id=user_info["google_id"],
-                profile_picture=user_info.get("picture"),
-                is_active=True
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+        user = await upsert_google_user(db, user_info)
         
         # Generate JWT token
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -181,39 +204,14 @@ async def google_callback(
 @router.post("/google/token", response_model=Token)
 async def google_token_login(
     token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """Login with Google ID token (for frontend use)"""
     try:
         # Verify ID token and get user info
         user_info = await google_oauth.verify_id_token(token)
         
-        # Check if user exists
-        user = db.query(User).filter(
-            (User.google_id == user_info["google_id"]) | 
-            (User.email == user_info["email"])
-        ).first()
-        
-        if user:
-            # Update existing user with Google info if not already set
-            if not user.google_id:
-                user.google_id = user_info["google_id"]
-                user.profile_picture = user_info.get("picture")
-                db.commit()
-                db.refresh(user)
-        else:
-            # Create new user
-            user = User(
-                email=user_info["email"],
-                username=user_info["email"],  # Use email as username for Google users
-                full_name=user_info["name"],
-                google_id=user_info["google_id"],
-                profile_picture=user_info.get("picture"),
-                is_active=True
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+        user = await upsert_google_user(db, user_info)
         
         # Generate JWT token
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -223,6 +221,8 @@ async def google_token_login(
         
         return {"access_token": access_token, "token_type": "bearer"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -233,7 +233,7 @@ async def google_token_login(
 
 @router.get("/me", response_model=UserResponse)
 def get_current_user(
-    current_user: User = Depends(security.get_current_user)
+    current_user: User = Depends(deps.get_current_user)
 ) -> Any:
     """Get current user profile"""
     return current_user
\ No newline at end of file
@@ -1,15 +1,33 @@
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, date
-from app.api.deps import get_current_active_user, get_db
+from app.api.deps import get_current_active_user, get_async_db
 from app.models.user import User
 from app.models.expense import Expense, ExpenseCategory
-from pydantic import BaseModel
+from app.worker import schedule_expense_monthly_refresh
+from pydantic import BaseModel, ConfigDict
 
 router = APIRouter()
 
+# Columns serialized by ExpenseResponse
+expense_columns = (
+    Expense.id,
+    Expense.user_id,
+    Expense.invoice_id,
+    Expense.date,
+    Expense.merchant,
+    Expense.amount,
+    Expense.category,
+    Expense.ai_category,
+    Expense.description,
+    Expense.tags,
+    Expense.created_at,
+    Expense.updated_at,
+)
+
 
 class ExpenseBase(BaseModel):
     date: datetime
@@ -38,12 +56,11 @@ class ExpenseResponse(ExpenseBase):
     created_at: datetime
     updated_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 @router.get("/", response_model=List[ExpenseResponse])
-def list_expenses(
+async def list_expenses(
     skip: int = 0,
     limit: int = 100,
     start_date: Optional[date] = None,
@@ -52,58 +69,65 @@ def list_expenses(
     merchant: Optional[str] = None,
     min_amount: Optional[float] = None,
     max_amount: Optional[float] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """List expenses with filters"""
-    query = db.query(Expense).filter(Expense.user_id == current_user.id)
+    query = select(*expense_columns).where(Expense.user_id == current_user.id)
     
     # Apply filters
     if start_date:
-        query = query.filter(Expense.date >= start_date)
+        query = query.where(Expense.date >= start_date)
     if end_date:
-        query = query.filter(Expense.date <= end_date)
+        query = query.where(Expense.date <= end_date)
     if category:
-        query = query.filter(Expense.category == category)
+        query = query.where(Expense.category == category)
     if merchant:
-        query = query.filter(Expense.merchant.ilike(f"%{merchant}%"))
+        query = query.where(Expense.merchant.ilike(f"%{merchant}%"))
     if min_amount is not None:
-        query = query.filter(Expense.amount >= min_amount)
+        query = query.where(Expense.amount >= min_amount)
     if max_amount is not None:
-        query = query.filter(Expense.amount <= max_amount)
+        query = query.where(Expense.amount <= max_amount)
     
-    expenses = query.order_by(Expense.date.desc()).offset(skip).limit(limit).all()
-    return expenses
+    # Plain row mappings; no ORM instances are built for a read-only listing.
+    # The rows already match ExpenseResponse, so they go straight to orjson
+    # and skip the per-row response_model validation
+    query = query.order_by(Expense.date.desc()).offset(skip).limit(limit)
+    rows = (await db.execute(query)).mappings()
+    return ORJSONResponse([dict(row) for row in rows])
 
 
 @router.post("/", response_model=ExpenseResponse)
-def create_expense(
+async def create_expense(
     expense_in: ExpenseCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Manually create an expense"""
     expense = Expense(
         user_id=current_user.id,
-        **expense_in.dict()
+        **expense_in.model_dump()
     )
     db.add(expense)
-    db.commit()
-    db.refresh(expense)
+    await db.commit()
+    await db.refresh(expense)
+    await schedule_expense_monthly_refresh()
     return expense
 
 
 @router.get("/{expense_id}", response_model=ExpenseResponse)
-def get_expense(
+async def get_expense(
     expense_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get expense details"""
-    expense = db.query(Expense).filter(
-        Expense.id == expense_id,
-        Expense.user_id == current_user.id
-    ).first()
+    expense = await db.scalar(
+        select(Expense).where(
+            Expense.id == expense_id,
+            Expense.user_id == current_user.id
+        )
+    )
     
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
@@ -112,49 +136,55 @@ def get_expense(
 
 
 @router.patch("/{expense_id}", response_model=ExpenseResponse)
-def update_expense(
+async def update_expense(
     expense_id: int,
     expense_update: ExpenseUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Update expense details"""
-    expense = db.query(Expense).filter(
-        Expense.id == expense_id,
-        Expense.user_id == current_user.id
-    ).first()
+    expense = await db.scalar(
+        select(Expense).where(
+            Expense.id == expense_id,
+            Expense.user_id == current_user.id
+        )
+    )
     
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    update_data = expense_update.dict(exclude_unset=True)
+    update_data = expense_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(expense, field, value)
     
     expense.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(expense)
+    await db.commit()
+    await db.refresh(expense)
+    await schedule_expense_monthly_refresh()
     
     return expense
 
 
 @router.delete("/{expense_id}")
-def delete_expense(
+async def delete_expense(
     expense_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Delete an expense"""
-    expense = db.query(Expense).filter(
-        Expense.id == expense_id,
-        Expense.user_id == current_user.id
-    ).first()
+    # A single DELETE; RETURNING tells us whether the expense existed
+    deleted = await db.scalar(
+        delete(Expense).where(
+            Expense.id == expense_id,
+            Expense.user_id == current_user.id
+        ).returning(Expense.id)
+    )
     
-    if not expense:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    db.delete(expense)
-    db.commit()
+    await db.commit()
+    await schedule_expense_monthly_refresh()
     
     return {"message": "Expense deleted successfully"}
 
@@ -162,14 +192,16 @@ def delete_expense(
 @router.post("/{expense_id}/categorize", response_model=ExpenseResponse)
 async def recategorize_expense(
     expense_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Re-run AI categorization for an expense"""
-    expense = db.query(Expense).filter(
-        Expense.id == expense_id,
-        Expense.user_id == current_user.id
-    ).first()
+    expense = await db.scalar(
+        select(Expense).where(
+            Expense.id == expense_id,
+            Expense.user_id == current_user.id
+        )
+    )
     
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
@@ -186,8 +218,9 @@ async def recategorize_expense(
         expense.ai_category = ai_category
         expense.category = ai_category  # Also update the main category
         expense.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(expense)
+        await db.commit()
+        await db.refresh(expense)
+        await schedule_expense_monthly_refresh()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI categorization failed: {str(e)}")
     
@@ -196,30 +229,38 @@ async def recategorize_expense(
 
 @router.post("/categorize-batch")
 async def categorize_expenses_batch(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Re-run AI categorization for all uncategorized expenses"""
     from app.core.ai_client import ai_client
     
-    # Get all uncategorized expenses for the user
-    uncategorized_expenses = db.query(Expense).filter(
-        Expense.user_id == current_user.id,
-        Expense.category == ExpenseCategory.OTHER
-    ).all()
+    # Get all uncategorized expenses for the user, only the columns the AI needs
+    uncategorized_expenses = (await db.execute(
+        select(
+            Expense.id,
+            Expense.merchant,
+            Expense.amount,
+            Expense.description
+        ).where(
+            Expense.user_id == current_user.id,
+            Expense.category == ExpenseCategory.OTHER
+        )
+    )).all()
     
     if not uncategorized_expenses:
         return {"message": "No uncategorized expenses found", "categorized_count": 0}
     
     # Prepare data for AI
-    expense_data = []
-    for expense in uncategorized_expenses:
-        expense_data.append({
-            'id': expense.id,
-            'merchant': expense.merchant,
-            'amount': float(expense.amount),
-            'description': expense.description or ''
-        })
+    expense_data = [
+        {
+            'id': expense_id,
+            'merchant': merchant,
+            'amount': float(amount),
+            'description': description or ''
+        }
+        for expense_id, merchant, amount, description in uncategorized_expenses
+    ]
     
     try:
         # Get AI categorizations
@@ -228,17 +269,26 @@ async def categorize_expenses_batch(
         if not categorizations:
             raise HTTPException(status_code=500, detail="AI categorization failed")
         
-        # Update expenses with AI categories
-        updated_count = 0
-        for expense in uncategorized_expenses:
-            if expense.id in categorizations:
-                new_category = categorizations[expense.id]
-                expense.category = new_category
-                expense.ai_category = new_category
-                expense.updated_at = datetime.utcnow()
-                updated_count += 1
+        # Update expenses with AI categories in one executemany by primary key
+        now = datetime.utcnow()
+        expense_ids = {row.id for row in uncategorized_expenses}
+        mappings = [
+            {
+                "id": expense_id,
+                "category": new_category,
+                "ai_category": new_category,
+                "updated_at": now
+            }
+            for expense_id, new_category in categorizations.items()
+            if expense_id in expense_ids
+        ]
+        if mappings:
+            await db.execute(update(Expense), mappings)
+        updated_count = len(mappings)
         
-        db.commit()
+        await db.commit()
+        if mappings:
+            await schedule_expense_monthly_refresh()
         
         return {
             "message": f"Successfully categorized {updated_count} expenses",
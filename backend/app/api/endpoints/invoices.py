@@ -1,16 +1,16 @@
 from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
-from sqlalchemy.orm import Session
-from app.api.deps import get_current_active_user, get_db
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_current_active_user, get_async_db
 from app.models.user import User
 from app.models.invoice import Invoice, InvoiceStatus
 from app.models.expense import Expense
-from app.services.invoice_parser import InvoiceParser
-from app.services.expense_categorizer import ExpenseCategorizer
-from app.core.ai_client import ai_client
-from pydantic import BaseModel
+from app.worker import process_invoice
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from typing import Optional
+import asyncio
 import shutil
 import os
 from pathlib import Path
@@ -26,22 +26,50 @@ class InvoiceResponse(BaseModel):
     error_message: Optional[str]
     expense_count: int = 0
     total_amount: float = 0
+    summary: Optional[dict] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class InvoiceUploadResponse(BaseModel):
     invoice_id: int
+    status: InvoiceStatus
     message: str
-    summary: dict
+    # Parsing happens in the background, so the summary is always None here;
+    # poll GET /invoices/{invoice_id} until status is processed to read it
+    summary: Optional[dict] = None
+
+
+def save_upload(file: UploadFile, file_path: Path) -> None:
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+# Invoices joined with their expense count and total, one row per invoice
+invoice_totals = select(
+    Invoice,
+    func.count(Expense.id),
+    func.coalesce(func.sum(Expense.amount), 0)
+).outerjoin(Expense, Expense.invoice_id == Invoice.id).group_by(Invoice.id)
+
+
+def invoice_response(invoice: Invoice, expense_count: int, total_amount: float) -> dict:
+    return {
+        "id": invoice.id,
+        "filename": invoice.filename,
+        "status": invoice.status,
+        "processed_at": invoice.processed_at,
+        "error_message": invoice.error_message,
+        "expense_count": expense_count,
+        "total_amount": total_amount,
+        "summary": invoice.invoice_metadata
+    }
 
 
 @router.post("/upload", response_model=InvoiceUploadResponse)
 async def upload_invoice(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Upload and process invoice file"""
@@ -53,10 +81,9 @@ async def upload_invoice(
     upload_dir = Path("uploads") / str(current_user.id)
     upload_dir.mkdir(parents=True, exist_ok=True)
     
-    # Save file
+    # Save file off the event loop so concurrent requests keep being served
     file_path = upload_dir / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file, file_path)
     
     # Create invoice record
     invoice = Invoice(
@@ -66,166 +93,91 @@ async def upload_invoice(
         status=InvoiceStatus.PENDING
     )
     db.add(invoice)
-    db.commit()
-    db.refresh(invoice)
-    
-    # Process invoice in background
-    background_tasks.add_task(process_invoice_task, invoice.id, str(file_path), db)
+    await db.commit()
+    await db.refresh(invoice)
     
-    # Parse for immediate summary
-    parser = InvoiceParser()
-    try:
-        expenses = parser.parse_csv_invoice(str(file_path))
-        summary = parser.get_summary(expenses)
-    except:
-        summary = {"error": "Failed to parse invoice"}
+    # Parsing and categorization happen on a Celery worker; the summary is
+    # stored on the invoice once it is processed. Publishing is blocking I/O,
+    # so it runs off the event loop
+    await asyncio.to_thread(process_invoice.delay, invoice.id)
     
     return {
         "invoice_id": invoice.id,
+        "status": invoice.status,
         "message": "Invoice uploaded successfully and is being processed",
-        "summary": summary
+        "summary": None
     }
 
 
-async def process_invoice_task(invoice_id: int, file_path: str, db: Session):
-    """Background task to process invoice"""
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-    if not invoice:
-        return
-    
-    try:
-        # Update status
-        invoice.status = InvoiceStatus.PROCESSING
-        db.commit()
-        
-        # Parse invoice
-        parser = InvoiceParser()
-        raw_expenses = parser.parse_csv_invoice(file_path)
-        valid_expenses = parser.validate_expenses(raw_expenses)
-        
-        # Categorize expenses
-        categorizer = ExpenseCategorizer()
-        
-        for expense_data in valid_expenses:
-            # Rule-based categorization
-            category = categorizer.categorize_by_rules(
-                expense_data['merchant'], 
-                expense_data['amount']
-            )
-            
-            # AI categorization (async)
-            try:
-                ai_category = await ai_client.categorize_expense(
-                    expense_data['merchant'],
-                    expense_data['amount'],
-                    expense_data.get('original_description')
-                )
-            except:
-                ai_category = category
-            
-            # Create expense record
-            expense = Expense(
-                user_id=invoice.user_id,
-                invoice_id=invoice.id,
-                date=expense_data['date'],
-                merchant=expense_data['merchant'],
-                amount=expense_data['amount'],
-                category=category,
-                ai_category=ai_category,
-                description=expense_data.get('original_description'),
-                expense_metadata=expense_data.get('metadata')
-            )
-            db.add(expense)
-        
-        # Update invoice status
-        invoice.status = InvoiceStatus.PROCESSED
-        invoice.processed_at = datetime.utcnow()
-        invoice.invoice_metadata = parser.get_summary(valid_expenses)
-        
-        db.commit()
-        
-    except Exception as e:
-        invoice.status = InvoiceStatus.FAILED
-        invoice.error_message = str(e)
-        db.commit()
-
-
 @router.get("/", response_model=List[InvoiceResponse])
-def list_invoices(
+async def list_invoices(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """List user's invoices"""
-    invoices = db.query(Invoice).filter(
-        Invoice.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    
-    # Add expense count and total for each invoice
-    result = []
-    for invoice in invoices:
-        invoice_dict = {
-            "id": invoice.id,
-            "filename": invoice.filename,
-            "status": invoice.status,
-            "processed_at": invoice.processed_at,
-            "error_message": invoice.error_message,
-            "expense_count": len(invoice.expenses),
-            "total_amount": sum(e.amount for e in invoice.expenses)
-        }
-        result.append(invoice_dict)
-    
-    return result
+    # Expense count and total for each invoice in the same query
+    rows = (await db.execute(
+        invoice_totals.where(
+            Invoice.user_id == current_user.id
+        ).offset(skip).limit(limit)
+    )).all()
+    
+    return [invoice_response(*row) for row in rows]
 
 
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
-def get_invoice(
+async def get_invoice(
     invoice_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Get invoice details"""
-    invoice = db.query(Invoice).filter(
-        Invoice.id == invoice_id,
-        Invoice.user_id == current_user.id
-    ).first()
-    
-    if not invoice:
+    row = (await db.execute(
+        invoice_totals.where(
+            Invoice.id == invoice_id,
+            Invoice.user_id == current_user.id
+        )
+    )).first()
+    
+    if not row:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    return {
-        "id": invoice.id,
-        "filename": invoice.filename,
-        "status": invoice.status,
-        "processed_at": invoice.processed_at,
-        "error_message": invoice.error_message,
-        "expense_count": len(invoice.expenses),
-        "total_amount": sum(e.amount for e in invoice.expenses)
-    }
+    return invoice_response(*row)
 
 
 @router.delete("/{invoice_id}")
-def delete_invoice(
+async def delete_invoice(
     invoice_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ) -> Any:
     """Delete invoice and associated expenses"""
-    invoice = db.query(Invoice).filter(
-        Invoice.id == invoice_id,
-        Invoice.user_id == current_user.id
-    ).first()
-    
-    if not invoice:
+    # Detach the invoice's expenses as the ORM delete did, then delete the
+    # invoice in one statement that also returns its file path
+    await db.execute(
+        update(Expense).where(
+            Expense.invoice_id == invoice_id,
+            Expense.user_id == current_user.id
+        ).values(invoice_id=None)
+    )
+    result = (await db.execute(
+        delete(Invoice).where(
+            Invoice.id == invoice_id,
+            Invoice.user_id == current_user.id
+        ).returning(Invoice.file_path)
+    )).first()
+    
+    if not result:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    # Delete file if exists
-    if invoice.file_path and os.path.exists(invoice.file_path):
-        os.remove(invoice.file_path)
+    await db.commit()
     
-    # Delete invoice (expenses will be cascade deleted)
-    db.delete(invoice)
-    db.commit()
+    # Delete file if exists
+    file_path = result.file_path
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
     
     return {"message": "Invoice deleted successfully"}
\ No newline at end of file
@@ -1,54 +1,96 @@
 from typing import Dict, List, Optional, Any
 import openai
+from app.core.cache import cache
 from app.core.config import settings
+from app.core.worker_pool import WorkerPool
 from app.models.expense import ExpenseCategory
+import hashlib
 import json
 import httpx
 import asyncio
 
 
+# Common variations the model answers with, mapped to category values
+_STR_MAP = {
+    'food': 'food',
+    'transportation': 'transport',
+    'transport': 'transport',
+    'shopping': 'shopping',
+    'retail': 'shopping',
+    'health': 'health',
+    'healthcare': 'health',
+    'medical': 'health',
+    'entertainment': 'entertainment',
+    'utilities': 'utilities',
+    'bills': 'utilities',
+    'education': 'education',
+    'other': 'other'
+}
+
+_CATEGORY_MAP = {category.value: category for category in ExpenseCategory}
+
+# Static instructions for single-expense categorization. Kept in the system
+# message so the provider can cache the prefix; the user message carries only
+# the transaction as "merchant|amount|description".
+SYSTEM_PROMPT = """You are an expert financial categorization assistant. Be precise and consider Brazilian merchant patterns.
+
+Each message is one transaction formatted as: merchant|amount in R$|description (may be empty)
+
+Available categories:
+- food: Restaurants, supermarkets, groceries, delivery, bars, cafes, food purchases
+- transport: Uber, taxi, gas stations, parking, tolls, car services, public transport
+- shopping: Retail stores, online shopping, clothing, electronics, home goods, Amazon, Mercado Livre
+- health: Pharmacies, medical services, dentist, hospitals, fitness, insurance
+- entertainment: Streaming services, movies, games, concerts, travel, social activities
+- utilities: Bills, subscriptions, banking fees, taxes, phone, internet, insurance, rent
+- education: Schools, courses, books, educational materials, online learning
+- other: Only use if none of the above categories clearly apply
+
+Context clues:
+- Brazilian merchants often use Portuguese names
+- IFD* = iFood (food delivery app) - ALWAYS categorize as food
+- MP* = MercadoPago payment processor
+- EC* = Electronic Commerce payment processor
+- Look for key Portuguese words: supermercado, farmacia, combustivel, etc.
+- Consider the amount - small amounts might be snacks/parking, large amounts might be rent/shopping
+
+Respond with only the most appropriate category name in lowercase."""
+
+
 class AIClient:
     def __init__(self):
         self.openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         self.fastmcp_url = settings.FASTMCP_SERVER_URL
+        # Shared gate so bursts of requests don't stampede the OpenAI API
+        self.pool = WorkerPool(
+            size=settings.AI_CONCURRENCY,
+            rate=settings.AI_REQUESTS_PER_SECOND
+        )
+    
+    async def _create_completion(self, **kwargs: Any) -> Any:
+        """Create a chat completion through the shared worker pool"""
+        return await self.pool.run(
+            lambda: self.openai_client.chat.completions.create(**kwargs)
+        )
         
+    def _category_cache_key(self, merchant: str, amount: float) -> str:
+        """Cache key shared by the same merchant at a similar amount (nearest R$ 10)"""
+        merchant_hash = hashlib.blake2b(merchant.lower().encode(), digest_size=16).hexdigest()
+        return f"ai:category:{merchant_hash}:{round(amount, -1):.0f}"
+    
     async def categorize_expense(self, merchant: str, amount: float, description: Optional[str] = None) -> ExpenseCategory:
         """Use AI to categorize an expense based on merchant and amount"""
-        prompt = f"""
-        You are an expert financial categorization assistant. Analyze this transaction and categorize it accurately:
-
-        Merchant: {merchant}
-        Amount: R$ {amount:.2f}
-        Description: {description or 'N/A'}
-
-        Available categories:
-        - food: Restaurants, supermarkets, groceries, delivery, bars, cafes, food purchases
-        - transport: Uber, taxi, gas stations, parking, tolls, car services, public transport
-        - shopping: Retail stores, online shopping, clothing, electronics, home goods, Amazon, Mercado Livre
-        - health: Pharmacies, medical services, dentist, hospitals, fitness, insurance
-        - entertainment: Streaming services, movies, games, concerts, travel, social activities
-        - utilities: Bills, subscriptions, banking fees, taxes, phone, internet, insurance, rent
-        - education: Schools, courses, books, educational materials, online learning
-        - other: Only use if none of the above categories clearly apply
-
-        Context clues:
-        - Brazilian merchants often use Portuguese names
-        - IFD* = iFood (food delivery app) - ALWAYS categorize as food
-        - MP* = MercadoPago payment processor 
-        - EC* = Electronic Commerce payment processor
-        - Look for key Portuguese words: supermercado, farmacia, combustivel, etc.
-        - Consider the amount - small amounts might be snacks/parking, large amounts might be rent/shopping
-
-        Based on the merchant name, amount, and context, what is the MOST APPROPRIATE category?
-        Respond with only the category name in lowercase.
-        """
+        cache_key = self._category_cache_key(merchant, amount)
+        cached = await cache.get_json(cache_key)
+        if cached is not None:
+            return ExpenseCategory(cached)
         
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._create_completion(
                 model=settings.AI_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are an expert financial categorization assistant. Be precise and consider Brazilian merchant patterns."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": f"{merchant}|{amount:.2f}|{description or ''}"}
                 ],
                 temperature=0.1,
                 max_tokens=20
@@ -57,37 +99,16 @@ class AIClient:
             category_str = response.choices[0].message.content.strip().lower()
             
             # Map common variations to correct categories
-            category_mapping = {
-                'food': 'food',
-                'transportation': 'transport',
-                'transport': 'transport',
-                'shopping': 'shopping',
-                'retail': 'shopping',
-                'health': 'health',
-                'healthcare': 'health',
-                'medical': 'health',
-                'entertainment': 'entertainment',
-                'utilities': 'utilities',
-                'bills': 'utilities',
-                'education': 'education',
-                'other': 'other'
-            }
+            category = _CATEGORY_MAP.get(_STR_MAP.get(category_str, 'other'), ExpenseCategory.OTHER)
             
-            # Find the best match
-            mapped_category = category_mapping.get(category_str, 'other')
-            
-            # Validate against enum
-            if mapped_category in ExpenseCategory._value2member_map_:
-                return ExpenseCategory(mapped_category)
-            else:
-                return ExpenseCategory.OTHER
+            await cache.set_json(cache_key, category.value, settings.AI_CATEGORY_CACHE_TTL_SECONDS)
+            return category
                 
         except Exception as e:
             print(f"AI categorization error: {e}")
             # Fallback to enhanced rule-based categorization
-            from app.services.expense_categorizer import ExpenseCategorizer
-            categorizer = ExpenseCategorizer()
-            return categorizer.categorize_with_enhanced_rules(merchant, amount, description)
+            from app.services.expense_categorizer import expense_categorizer
+            return expense_categorizer.categorize_with_enhanced_rules(merchant, amount, description)
     
     async def analyze_spending_patterns(self, expenses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze spending patterns and provide insights"""
@@ -107,7 +128,7 @@ class AIClient:
         """
         
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._create_completion(
                 model=settings.AI_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a financial advisor assistant."},
@@ -140,7 +161,7 @@ class AIClient:
         """
         
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._create_completion(
                 model=settings.AI_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a financial forecasting assistant."},
@@ -168,7 +189,7 @@ class AIClient:
             user_message = f"Context: {json.dumps(context, default=str)}\n\nQuestion: {message}"
         
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._create_completion(
                 model=settings.AI_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -183,11 +204,8 @@ class AIClient:
             print(f"AI chat error: {e}")
             return "I'm sorry, I couldn't process your request. Please try again."
     
-    async def categorize_expenses_batch(self, expenses: List[Dict[str, Any]]) -> Dict[int, ExpenseCategory]:
-        """Categorize multiple expenses efficiently using AI"""
-        if not expenses:
-            return {}
-        
+    async def _categorize_chunk(self, expenses: List[Dict[str, Any]]) -> Dict[int, ExpenseCategory]:
+        """Categorize one sub-batch of expenses in a single AI request"""
         # Prepare batch data
         expense_data = []
         for expense in expenses:
@@ -225,58 +243,91 @@ class AIClient:
         {{"1": "food", "2": "transport", "3": "shopping"}}
         """
         
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=settings.AI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are an expert financial categorization assistant. Return only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            
-            # Convert string IDs to int and validate categories
-            categorized = {}
-            category_mapping = {
-                'food': ExpenseCategory.FOOD,
-                'transport': ExpenseCategory.TRANSPORT,
-                'shopping': ExpenseCategory.SHOPPING,
-                'health': ExpenseCategory.HEALTH,
-                'entertainment': ExpenseCategory.ENTERTAINMENT,
-                'utilities': ExpenseCategory.UTILITIES,
-                'education': ExpenseCategory.EDUCATION,
-                'other': ExpenseCategory.OTHER
-            }
-            
-            for expense_id, category_str in result.items():
-                try:
-                    int_id = int(expense_id)
-                    category = category_mapping.get(category_str.lower(), ExpenseCategory.OTHER)
-                    categorized[int_id] = category
-                except (ValueError, KeyError):
-                    continue
-            
-            return categorized
-            
-        except Exception as e:
-            print(f"AI batch categorization error: {e}")
-            # Fallback to enhanced rule-based categorization for all expenses
-            from app.services.expense_categorizer import ExpenseCategorizer
-            categorizer = ExpenseCategorizer()
-            categorized = {}
+        response = await self._create_completion(
+            model=settings.AI_MODEL,
+            messages=[
+                {"role": "system", "content": "You are an expert financial categorization assistant. Return only valid JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        
+        result = json.loads(response.choices[0].message.content)
+        
+        # Convert string IDs to int and validate categories
+        categorized = {}
+        
+        for expense_id, category_str in result.items():
+            try:
+                int_id = int(expense_id)
+                category = _CATEGORY_MAP.get(category_str.lower(), ExpenseCategory.OTHER)
+                categorized[int_id] = category
+            except (ValueError, KeyError):
+                continue
+        
+        return categorized
+    
+    async def categorize_expenses_batch(self, expenses: List[Dict[str, Any]]) -> Dict[int, ExpenseCategory]:
+        """Categorize multiple expenses efficiently using AI"""
+        if not expenses:
+            return {}
+        
+        # Merchants seen recently are answered from the cache; only the rest
+        # go to the AI
+        cache_keys = {
+            expense['id']: self._category_cache_key(expense['merchant'], expense['amount'])
+            for expense in expenses
+        }
+        cached = await cache.get_many_json(list(cache_keys.values()))
+        cached_categories = {
+            expense_id: ExpenseCategory(value)
+            for expense_id, value in zip(cache_keys, cached)
+            if value is not None
+        }
+        expenses = [expense for expense in expenses if expense['id'] not in cached_categories]
+        if not expenses:
+            return cached_categories
+        
+        # Bounded sub-batches keep each prompt within token limits; they run
+        # concurrently, gated by the shared worker pool
+        batch_size = settings.AI_BATCH_SIZE
+        chunks = [expenses[start:start + batch_size] for start in range(0, len(expenses), batch_size)]
+        results = await asyncio.gather(
+            *[self._categorize_chunk(chunk) for chunk in chunks],
+            return_exceptions=True
+        )
+        
+        categorized = {}
+        fallback_expenses = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                print(f"AI batch categorization error: {result}")
+                fallback_expenses.extend(chunk)
+            else:
+                categorized.update(result)
+        
+        await cache.set_many_json(
+            {
+                cache_keys[expense_id]: category.value
+                for expense_id, category in categorized.items()
+                if expense_id in cache_keys
+            },
+            settings.AI_CATEGORY_CACHE_TTL_SECONDS
+        )
+        
+        # Fallback to enhanced rule-based categorization for failed sub-batches
+        if fallback_expenses:
+            from app.services.expense_categorizer import expense_categorizer
             
-            for expense in expenses:
-                category = categorizer.categorize_with_enhanced_rules(
+            for expense in fallback_expenses:
+                category = expense_categorizer.categorize_with_enhanced_rules(
                     expense['merchant'], 
                     expense['amount'], 
                     expense.get('description', '')
                 )
                 categorized[expense['id']] = category
-            
-            return categorized
-
+        
+        return {**cached_categories, **categorized}
 
 ai_client = AIClient()
\ No newline at end of file
@@ -0,0 +1,55 @@
+from typing import Any, Dict, List, Optional
+import json
+import redis.asyncio as redis
+from app.core.config import settings
+
+
+class Cache:
+    def __init__(self):
+        self.redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+    
+    async def get_json(self, key: str) -> Optional[Any]:
+        """Return the cached JSON value for key, or None on a miss"""
+        try:
+            cached = await self.redis.get(key)
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+        
+        return json.loads(cached) if cached is not None else None
+    
+    async def set_json(self, key: str, value: Any, ttl: int) -> None:
+        """Store value as JSON under key for ttl seconds"""
+        try:
+            await self.redis.set(key, json.dumps(value, default=str), ex=ttl)
+        except Exception as e:
+            print(f"Cache write error: {e}")
+    
+    async def get_many_json(self, keys: List[str]) -> List[Optional[Any]]:
+        """Return the cached JSON values for keys in one round trip, None for each miss"""
+        if not keys:
+            return []
+        
+        try:
+            cached = await self.redis.mget(keys)
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return [None] * len(keys)
+        
+        return [json.loads(value) if value is not None else None for value in cached]
+    
+    async def set_many_json(self, values: Dict[str, Any], ttl: int) -> None:
+        """Store several key/value pairs as JSON for ttl seconds in one round trip"""
+        if not values:
+            return
+        
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.set(key, json.dumps(value, default=str), ex=ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+
+cache = Cache()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import AnyHttpUrl, validator
@@ -14,6 +15,11 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_QUERY_CACHE_SIZE: int = 1200
+    # Expense writes within this window share one refresh of the monthly view
+    EXPENSE_MONTHLY_REFRESH_DELAY_SECONDS: int = 30
     
     # Elasticsearch
     ELASTICSEARCH_URL: str
@@ -31,11 +37,18 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     FASTMCP_SERVER_URL: Optional[str] = None
     AI_MODEL: str = "gpt-4o-mini"
+    AI_CACHE_TTL_SECONDS: int = 3600
+    AI_CHAT_CONTEXT_TTL_SECONDS: int = 60
+    AI_CATEGORY_CACHE_TTL_SECONDS: int = 86400
+    AI_CONCURRENCY: int = 8
+    AI_REQUESTS_PER_SECOND: float = 5.0
+    AI_BATCH_SIZE: int = 50
     
     # Google OAuth
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str = "http://localhost:8000/api/auth/google/callback"
+    GOOGLE_CERTS_TTL_SECONDS: int = 3600
     
     # CORS
     CORS_ORIGINS: List[str] = []
@@ -53,4 +66,10 @@ class Settings(BaseSettings):
     )
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    """Settings are read from the environment and .env once per process"""
+    return Settings()
+
+
+settings = get_settings()
\ No newline at end of file
@@ -0,0 +1,27 @@
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class WorkerPool:
+    """Bound the number of in-flight calls and space out their start times"""
+    
+    def __init__(self, size: int, rate: float):
+        self.semaphore = asyncio.Semaphore(size)
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_start = 0.0
+    
+    async def _wait_for_slot(self) -> None:
+        """Wait until the rate limit allows another call to start"""
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+    
+    async def run(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Run the coroutine produced by func once a worker slot is free"""
+        async with self.semaphore:
+            await self._wait_for_slot()
+            return await func()
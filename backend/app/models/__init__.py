@@ -1,5 +1,6 @@
 from .user import User
 from .invoice import Invoice, InvoiceStatus
 from .expense import Expense, ExpenseCategory
+from .expense_monthly import expense_monthly
 
-__all__ = ["User", "Invoice", "InvoiceStatus", "Expense", "ExpenseCategory"]
\ No newline at end of file
+__all__ = ["User", "Invoice", "InvoiceStatus", "Expense", "ExpenseCategory", "expense_monthly"]
\ No newline at end of file
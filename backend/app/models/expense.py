@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float, JSON, Enum
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float, JSON, Enum, Index, DDL, event
 from sqlalchemy.orm import relationship
 import enum
 from app.db.base import BaseModel
@@ -17,6 +17,27 @@ class ExpenseCategory(str, enum.Enum):
 
 class Expense(BaseModel):
     __tablename__ = "expenses"
+    __table_args__ = (
+        # Covers the per-user date range scans used by analytics and AI insights,
+        # including per-merchant totals, so they can be answered index-only
+        Index(
+            "ix_expenses_user_date",
+            "user_id",
+            "date",
+            postgresql_include=["amount", "category", "merchant"],
+        ),
+        # Category filters in list_expenses and uncategorized-expense lookups
+        Index("ix_expenses_user_category", "user_id", "category"),
+        # Per-invoice expense lookups and aggregates
+        Index("ix_expenses_invoice_id", "invoice_id"),
+        # Trigram index so merchant ILIKE '%...%' searches can use an index
+        Index(
+            "ix_expenses_merchant_trgm",
+            "merchant",
+            postgresql_using="gin",
+            postgresql_ops={"merchant": "gin_trgm_ops"},
+        ),
+    )
     
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     invoice_id = Column(Integer, ForeignKey("invoices.id"))
@@ -31,4 +52,11 @@ class Expense(BaseModel):
     
     # Relationships
     user = relationship("User", back_populates="expenses")
-    invoice = relationship("Invoice", back_populates="expenses")
\ No newline at end of file
+    invoice = relationship("Invoice", back_populates="expenses")
+
+
+event.listen(
+    Expense.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
\ No newline at end of file
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, DateTime, Float, Enum, MetaData, Table, DDL, event
+from app.models.expense import Expense, ExpenseCategory
+
+
+# Materialized view, so it is kept out of Base.metadata and never created as a table
+expense_monthly = Table(
+    "mv_expense_monthly",
+    MetaData(),
+    Column("user_id", Integer, nullable=False),
+    Column("month", DateTime(timezone=True), nullable=False),
+    Column("category", Enum(ExpenseCategory, create_type=False)),
+    Column("total", Float, nullable=False),
+    Column("count", Integer, nullable=False),
+    Column("last_modified", DateTime(timezone=True)),
+)
+
+
+CREATE_EXPENSE_MONTHLY = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_expense_monthly AS
+SELECT user_id,
+       date_trunc('month', date) AS month,
+       coalesce(category, 'OTHER') AS category,
+       sum(amount) AS total,
+       count(*)::integer AS count,
+       max(coalesce(updated_at, created_at)) AS last_modified
+FROM expenses
+GROUP BY 1, 2, 3
+"""
+
+CREATE_EXPENSE_MONTHLY_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS ix_mv_expense_monthly_user_month_category
+ON mv_expense_monthly (user_id, month, category)
+"""
+
+REFRESH_EXPENSE_MONTHLY = "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_expense_monthly"
+
+
+# Keep create_all / drop_all deployments in step with the migration
+for statement in (CREATE_EXPENSE_MONTHLY, CREATE_EXPENSE_MONTHLY_INDEX):
+    event.listen(
+        Expense.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+
+event.listen(
+    Expense.__table__,
+    "before_drop",
+    DDL("DROP MATERIALIZED VIEW IF EXISTS mv_expense_monthly").execute_if(dialect="postgresql"),
+)
@@ -4,19 +4,29 @@ Script to import existing invoice CSV files into the database
 """
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from datetime import datetime
 
 # Add the app directory to Python path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
+from sqlalchemy import insert, text
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, engine
 from app.models.user import User
 from app.models.invoice import Invoice, InvoiceStatus
 from app.models.expense import Expense
-from app.services.invoice_parser import InvoiceParser
-from app.services.expense_categorizer import ExpenseCategorizer
+from app.models.expense_monthly import REFRESH_EXPENSE_MONTHLY
+from app.services.invoice_parser import InvoiceParser, InvoiceSummary
+from app.services.expense_categorizer import expense_categorizer
+
+# Rows parsed, categorized and inserted per batch
+IMPORT_CHUNK_SIZE = 5000
+
+# Files imported in parallel, one database connection per worker process
+IMPORT_WORKERS = 4
 
 
 def import_csv_for_user(file_path: str, user_email: str, db: Session):
@@ -49,56 +59,77 @@ def import_csv_for_user(file_path: str, user_email: str, db: Session):
         status=InvoiceStatus.PROCESSING
     )
     db.add(invoice)
+    # The flush fills invoice.id from INSERT ... RETURNING; keeping the ids
+    # avoids reloading the expired instances after commit
+    db.flush()
+    user_id, invoice_id = user.id, invoice.id
     db.commit()
-    db.refresh(invoice)
     
     try:
-        # Parse invoice
         parser = InvoiceParser()
-        raw_expenses = parser.parse_csv_invoice(file_path)
-        valid_expenses = parser.validate_expenses(raw_expenses)
-        
-        print(f"Found {len(valid_expenses)} valid expenses")
-        
-        # Categorize expenses
-        categorizer = ExpenseCategorizer()
+        summary = InvoiceSummary()
         
-        for expense_data in valid_expenses:
-            # Rule-based categorization
-            category = categorizer.categorize_by_rules(
-                expense_data['merchant'], 
-                expense_data['amount']
-            )
+        # Parse, categorize and insert one chunk of rows at a time so memory
+        # stays flat regardless of file size. Core inserts don't accumulate
+        # in the session, so the whole file remains a single transaction.
+        for raw_expenses in parser.stream_csv_invoice(file_path, chunk_size=IMPORT_CHUNK_SIZE):
+            valid_expenses = parser.validate_expenses(raw_expenses)
+            if not valid_expenses:
+                continue
             
-            # Create expense record
-            expense = Expense(
-                user_id=user.id,
-                invoice_id=invoice.id,
-                date=expense_data['date'],
-                merchant=expense_data['merchant'],
-                amount=expense_data['amount'],
-                category=category,
-                ai_category=category,  # Use rule-based for now
-                description=expense_data.get('original_description'),
-                expense_metadata=expense_data.get('metadata', {})
+            # Rule-based categorization for the whole chunk in one pass
+            categories = expense_categorizer.categorize_batch(
+                [expense_data['merchant'] for expense_data in valid_expenses],
+                [expense_data['amount'] for expense_data in valid_expenses]
             )
-            db.add(expense)
+            
+            db.execute(insert(Expense), [
+                {
+                    "user_id": user_id,
+                    "invoice_id": invoice_id,
+                    "date": expense_data['date'],
+                    "merchant": expense_data['merchant'],
+                    "amount": expense_data['amount'],
+                    "category": category,
+                    "ai_category": category,  # Use rule-based for now
+                    "description": expense_data.get('original_description'),
+                    "expense_metadata": expense_data.get('metadata', {})
+                }
+                for expense_data, category in zip(valid_expenses, categories)
+            ])
+            summary.add(valid_expenses)
+        
+        expense_count = summary.total_expenses + summary.refund_count
+        print(f"Found {expense_count} valid expenses")
         
         # Update invoice status
         invoice.status = InvoiceStatus.PROCESSED
         invoice.processed_at = datetime.utcnow()
-        invoice.invoice_metadata = parser.get_summary(valid_expenses)
+        invoice.invoice_metadata = summary.to_dict()
         
         db.commit()
-        print(f"Successfully imported {len(valid_expenses)} expenses from {filename}")
+        print(f"Successfully imported {expense_count} expenses from {filename}")
         
     except Exception as e:
         print(f"Error processing invoice: {e}")
+        # Discard any chunks already inserted for this file
+        db.rollback()
         invoice.status = InvoiceStatus.FAILED
         invoice.error_message = str(e)
         db.commit()
 
 
+def init_import_worker():
+    """Drop pooled connections inherited from the parent process"""
+    engine.dispose(close=False)
+
+
+def import_file(file_path: str, user_email: str):
+    """Import one CSV file in its own session"""
+    with SessionLocal() as db:
+        import_csv_for_user(file_path, user_email, db)
+
+
 def main():
     """Main function to import all CSV files from the invoices folder"""
     # Get database session
@@ -133,9 +164,16 @@ def main():
                 print("No active users found. Please provide user email as argument.")
                 return
         
-        # Import each CSV file
-        for csv_file in csv_files:
-            import_csv_for_user(str(csv_file), user_email, db)
+        # Import the files concurrently, each worker process with its own session
+        with ProcessPoolExecutor(
+            max_workers=min(IMPORT_WORKERS, len(csv_files)),
+            initializer=init_import_worker
+        ) as pool:
+            list(pool.map(import_file, [str(csv_file) for csv_file in csv_files], repeat(user_email)))
+        
+        # Rebuild the monthly aggregate view once for everything imported
+        db.execute(text(REFRESH_EXPENSE_MONTHLY))
+        db.commit()
         
         print("Import completed!")
         
@@ -1,43 +1,81 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from dateutil.relativedelta import relativedelta
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import func, literal, select
 from app.models.expense import Expense, ExpenseCategory
+from app.models.expense_monthly import expense_monthly
 from app.models.user import User
 import pandas as pd
 from collections import defaultdict
+from functools import lru_cache
+import csv
+import io
+import orjson
+
+
+@lru_cache(maxsize=256)
+def _month_name(year: int, month: int) -> str:
+    """Display name such as 'January 2025'; the same few months repeat across rows"""
+    return datetime(year, month, 1).strftime('%B %Y')
+
+
+# Category column values to their exported strings; uncategorized is "other"
+_CAT_VALUE = {category: category.value for category in ExpenseCategory}
+_CAT_VALUE[None] = 'other'
+
+# Non-essential categories that get a suggested 10% reduction
+_REDUCIBLE_CATEGORIES = frozenset({'entertainment', 'shopping', 'food'})
+
+# (category, share of total spending above which the tip applies, tip)
+_CATEGORY_TIPS = (
+    ('food', 0.3, "Your food expenses are over 30% of total spending. Consider meal planning to reduce costs."),
+    ('entertainment', 0.15, "Entertainment spending is high. Look for free or low-cost alternatives."),
+)
+
+
+def _months_start(now: datetime, months: int) -> datetime:
+    """Start of the window covering the current month and the months - 1 before it"""
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - relativedelta(months=months - 1)
 
 
 class AnalyticsEngine:
     def __init__(self, db: Session):
         self.db = db
     
+    def _query(self, *entities: Any) -> Query:
+        """Read-only query: no autoflush check and no eager-loader setup"""
+        return self.db.query(*entities).autoflush(False).enable_eagerloads(False)
+    
     def get_spending_summary(self, user_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get spending summary for a user within date range"""
-        expenses = self.db.query(Expense).filter(
+        # Aggregated in the database; only totals and grouped rows come back
+        period_filter = (
             Expense.user_id == user_id,
             Expense.date >= start_date,
             Expense.date <= end_date
-        ).all()
+        )
         
-        total_spent = sum(e.amount for e in expenses)
+        total_spent, transaction_count = self._query(
+            func.coalesce(func.sum(Expense.amount), 0),
+            func.count(Expense.id)
+        ).filter(*period_filter).one()
         
         # Category breakdown
-        category_breakdown = defaultdict(float)
-        for expense in expenses:
-            category = expense.category or ExpenseCategory.OTHER
-            category_breakdown[category.value] += expense.amount
+        category = func.coalesce(Expense.category, literal(ExpenseCategory.OTHER, Expense.category.type))
+        category_breakdown = self._query(
+            category,
+            func.sum(Expense.amount)
+        ).filter(*period_filter).group_by(category).all()
         
         # Top merchants
-        merchant_spending = defaultdict(float)
-        for expense in expenses:
-            merchant_spending[expense.merchant] += expense.amount
-        
-        top_merchants = sorted(
-            merchant_spending.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10]
+        merchant_total = func.sum(Expense.amount)
+        top_merchants = self._query(
+            Expense.merchant,
+            merchant_total
+        ).filter(*period_filter).group_by(
+            Expense.merchant
+        ).order_by(merchant_total.desc()).limit(10).all()
         
         # Daily average
         days_in_period = (end_date - start_date).days + 1
@@ -45,9 +83,9 @@ class AnalyticsEngine:
         
         return {
             'total_spent': round(total_spent, 2),
-            'transaction_count': len(expenses),
+            'transaction_count': transaction_count,
             'daily_average': round(daily_average, 2),
-            'category_breakdown': {k: round(v, 2) for k, v in category_breakdown.items()},
+            'category_breakdown': {_CAT_VALUE[k]: round(v, 2) for k, v in category_breakdown},
             'top_merchants': [
                 {'merchant': m, 'amount': round(a, 2)} for m, a in top_merchants
             ],
@@ -59,62 +97,55 @@ class AnalyticsEngine:
     
     def get_monthly_trends(self, user_id: int, months: int = 12) -> List[Dict[str, Any]]:
         """Get monthly spending trends"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=months * 30)
-        
-        monthly_data = self.db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total'),
-            func.count(Expense.id).label('count')
+        start_date = _months_start(datetime.now(), months)
+        
+        # Read from the precomputed monthly totals per category, which are
+        # refreshed in the background after expenses change
+        monthly_data = self._query(
+            expense_monthly.c.month,
+            func.sum(expense_monthly.c.total).label('total'),
+            func.sum(expense_monthly.c.count).label('count')
         ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date
-        ).group_by('year', 'month').all()
-        
-        trends = []
-        for row in monthly_data:
-            trends.append({
-                'year': int(row.year),
-                'month': f"{int(row.year)}-{int(row.month):02d}",
+            expense_monthly.c.user_id == user_id,
+            expense_monthly.c.month >= start_date
+        ).group_by(expense_monthly.c.month).order_by(expense_monthly.c.month).all()
+        
+        return [
+            {
+                'year': row.month.year,
+                'month': row.month.strftime('%Y-%m'),
                 'total_spent': round(float(row.total), 2),
-                'transaction_count': row.count,
-                'month_name': datetime(int(row.year), int(row.month), 1).strftime('%B %Y')
-            })
-        
-        return sorted(trends, key=lambda x: x['month'])
+                'transaction_count': int(row.count),
+                'month_name': _month_name(row.month.year, row.month.month)
+            }
+            for row in monthly_data
+        ]
     
     def get_category_trends(self, user_id: int, months: int = 6) -> Dict[str, List[Dict[str, Any]]]:
         """Get spending trends by category over time"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=months * 30)
-        
-        expenses = self.db.query(Expense).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date
-        ).all()
-        
-        # Group by month and category
-        category_monthly = defaultdict(lambda: defaultdict(float))
-        
-        for expense in expenses:
-            month_key = expense.date.strftime('%Y-%m')
-            category = (expense.category or ExpenseCategory.OTHER).value
-            category_monthly[category][month_key] += expense.amount
+        start_date = _months_start(datetime.now(), months)
+        
+        # Read from the precomputed monthly totals per category, which are
+        # refreshed in the background after expenses change
+        rows = self._query(
+            expense_monthly.c.month,
+            expense_monthly.c.category,
+            expense_monthly.c.total
+        ).filter(
+            expense_monthly.c.user_id == user_id,
+            expense_monthly.c.month >= start_date
+        ).order_by(expense_monthly.c.month).all()
         
         # Format for frontend
-        trends = {}
-        for category, monthly_data in category_monthly.items():
-            trends[category] = [
-                {
-                    'month': month,
-                    'amount': round(amount, 2),
-                    'month_name': datetime.strptime(month, '%Y-%m').strftime('%B %Y')
-                }
-                for month, amount in sorted(monthly_data.items())
-            ]
+        trends = defaultdict(list)
+        for month_start, category, amount in rows:
+            trends[_CAT_VALUE[category]].append({
+                'month': month_start.strftime('%Y-%m'),
+                'amount': round(amount, 2),
+                'month_name': _month_name(month_start.year, month_start.month)
+            })
         
-        return trends
+        return dict(trends)
     
     def detect_unusual_spending(self, user_id: int) -> List[Dict[str, Any]]:
         """Detect unusual spending patterns"""
@@ -122,37 +153,38 @@ class AnalyticsEngine:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=90)
         
-        expenses = self.db.query(Expense).filter(
+        # Mean and sample standard deviation as window functions, so only the
+        # outliers (expenses > 2 standard deviations from mean) come back
+        stats = self._query(
+            Expense.id,
+            Expense.date,
+            Expense.merchant,
+            Expense.amount,
+            Expense.category,
+            func.avg(Expense.amount).over().label('mean'),
+            func.stddev_samp(Expense.amount).over().label('std'),
+            func.count(Expense.id).over().label('count')
+        ).filter(
             Expense.user_id == user_id,
             Expense.date >= start_date
-        ).all()
-        
-        if len(expenses) < 10:
-            return []
-        
-        # Calculate statistics
-        amounts = [e.amount for e in expenses]
-        df = pd.DataFrame(amounts, columns=['amount'])
-        
-        mean = df['amount'].mean()
-        std = df['amount'].std()
-        
-        # Find outliers (expenses > 2 standard deviations from mean)
-        unusual = []
-        threshold = mean + (2 * std)
-        
-        for expense in expenses:
-            if expense.amount > threshold:
-                unusual.append({
-                    'id': expense.id,
-                    'date': expense.date.isoformat(),
-                    'merchant': expense.merchant,
-                    'amount': expense.amount,
-                    'category': expense.category.value if expense.category else 'other',
-                    'deviation': round((expense.amount - mean) / std, 2)
-                })
-        
-        return sorted(unusual, key=lambda x: x['amount'], reverse=True)[:10]
+        ).subquery()
+        
+        outliers = self._query(stats).filter(
+            stats.c.count >= 10,
+            stats.c.amount > stats.c.mean + 2 * stats.c.std
+        ).order_by(stats.c.amount.desc()).limit(10).all()
+        
+        return [
+            {
+                'id': row.id,
+                'date': row.date.isoformat(),
+                'merchant': row.merchant,
+                'amount': row.amount,
+                'category': _CAT_VALUE[row.category],
+                'deviation': round((row.amount - row.mean) / row.std, 2)
+            }
+            for row in outliers
+        ]
     
     def get_budget_recommendations(self, user_id: int) -> Dict[str, Any]:
         """Generate budget recommendations based on spending history"""
@@ -175,7 +207,7 @@ class AnalyticsEngine:
             monthly_avg = amount / 3
             
             # Suggest 10% reduction for non-essential categories
-            if category in ['entertainment', 'shopping', 'food']:
+            if category in _REDUCIBLE_CATEGORIES:
                 suggested = monthly_avg * 0.9
                 recommendations['category_budgets'][category] = {
                     'current_avg': round(monthly_avg, 2),
@@ -191,11 +223,9 @@ class AnalyticsEngine:
         recommendations['savings_potential'] = round(recommendations['savings_potential'], 2)
         
         # Generate tips based on spending patterns
-        if summary['category_breakdown'].get('food', 0) > summary['total_spent'] * 0.3:
-            recommendations['tips'].append("Your food expenses are over 30% of total spending. Consider meal planning to reduce costs.")
-        
-        if summary['category_breakdown'].get('entertainment', 0) > summary['total_spent'] * 0.15:
-            recommendations['tips'].append("Entertainment spending is high. Look for free or low-cost alternatives.")
+        for category, share, tip in _CATEGORY_TIPS:
+            if summary['category_breakdown'].get(category, 0) > summary['total_spent'] * share:
+                recommendations['tips'].append(tip)
         
         if summary['daily_average'] > 100:
             recommendations['tips'].append("Your daily average spending is over $100. Review your expenses for potential savings.")
@@ -204,39 +234,87 @@ class AnalyticsEngine:
     
     def export_data(self, user_id: int, format: str = 'csv', start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Any:
         """Export expense data in various formats"""
-        query = self.db.query(Expense).filter(Expense.user_id == user_id)
+        if format == 'csv':
+            return ''.join(self.iter_csv(user_id, start_date, end_date))
+        
+        # Only the exported columns, as plain rows
+        query = self._query(
+            Expense.date,
+            Expense.merchant,
+            Expense.amount,
+            Expense.category,
+            Expense.description,
+            Expense.tags
+        ).filter(Expense.user_id == user_id)
         
         if start_date:
             query = query.filter(Expense.date >= start_date)
         if end_date:
             query = query.filter(Expense.date <= end_date)
         
-        expenses = query.all()
-        
-        # Convert to DataFrame
-        data = []
-        for expense in expenses:
-            data.append({
-                'date': expense.date,
-                'merchant': expense.merchant,
-                'amount': expense.amount,
-                'category': expense.category.value if expense.category else 'other',
-                'description': expense.description or '',
-                'tags': ','.join(expense.tags) if expense.tags else ''
-            })
-        
-        df = pd.DataFrame(data)
+        data = [
+            {
+                'date': date,
+                'merchant': merchant,
+                'amount': amount,
+                'category': _CAT_VALUE[category],
+                'description': description or '',
+                'tags': ','.join(tags) if tags else ''
+            }
+            for date, merchant, amount, category, description, tags in query
+        ]
         
-        if format == 'csv':
-            return df.to_csv(index=False)
-        elif format == 'json':
-            return df.to_json(orient='records', date_format='iso')
+        if format == 'json':
+            # Serialized straight from the rows, no DataFrame in between
+            return orjson.dumps(data)
         elif format == 'excel':
             # Return bytes for Excel file
-            import io
+            df = pd.DataFrame(data)
             buffer = io.BytesIO()
             df.to_excel(buffer, index=False, engine='openpyxl')
             buffer.seek(0)
             return buffer.getvalue()
         else:
-            raise ValueError(f"Unsupported format: {format}")
\ No newline at end of file
+            raise ValueError(f"Unsupported format: {format}")
+    
+    def iter_csv(self, user_id: int, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, batch_size: int = 1000) -> Iterator[str]:
+        """Yield expense data as CSV text, one batch of rows at a time"""
+        query = select(
+            Expense.date,
+            Expense.merchant,
+            Expense.amount,
+            Expense.category,
+            Expense.description,
+            Expense.tags
+        ).where(Expense.user_id == user_id)
+        
+        if start_date:
+            query = query.where(Expense.date >= start_date)
+        if end_date:
+            query = query.where(Expense.date <= end_date)
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(['date', 'merchant', 'amount', 'category', 'description', 'tags'])
+        
+        # Server-side cursor: only one batch of rows is held in memory
+        result = self.db.execute(query.execution_options(yield_per=batch_size, autoflush=False))
+        for rows in result.partitions():
+            writer.writerows(
+                (
+                    date,
+                    merchant,
+                    amount,
+                    _CAT_VALUE[category],
+                    description or '',
+                    ','.join(tags) if tags else ''
+                )
+                for date, merchant, amount, category, description, tags in rows
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        
+        # Header only when there are no expenses
+        if buffer.tell():
+            yield buffer.getvalue()
@@ -1,7 +1,125 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 from app.models.expense import ExpenseCategory
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+import ahocorasick
+import heapq
 import re
 
+# Characters that make a pattern alternative more than a plain keyword
+_REGEX_META = re.compile(r'[\\.^$*+?{}\[\]()|]')
+
+# Enhanced rules for common Brazilian merchants and patterns
+_ENHANCED_PATTERNS = {
+    ExpenseCategory.UTILITIES: [
+        r'subscription|assinatura',
+        r'taxa|fee|tarifa',
+        r'conta|bill',
+        r'pagamento|payment',
+        r'mensalidade|monthly',
+        r'anuidade|annual',
+        r'\.ai|\.com|digital',
+        r'servicos|services',
+        r'tecnologia|technology',
+        r'software|app',
+        r'cloud|storage'
+    ],
+    ExpenseCategory.SHOPPING: [
+        r'loja|store',
+        r'comercio|commerce',
+        r'varejo|retail',
+        r'produtos|products',
+        r'vendas|sales',
+        r'atacado|wholesale',
+        r'importacao|import',
+        r'distribuidora|distributor',
+        r'representacoes|representatives'
+    ],
+    ExpenseCategory.TRANSPORT: [
+        r'transporte|transport',
+        r'viagem|travel|trip',
+        r'carro|car|auto',
+        r'moto|motorcycle',
+        r'bike|bicicleta',
+        r'logistica|logistics',
+        r'entrega|delivery'
+    ],
+    ExpenseCategory.FOOD: [
+        r'alimento|food',
+        r'bebida|drink|beverage',
+        r'gourmet|delicatessen',
+        r'culinaria|culinary',
+        r'gastronomia|gastronomy',
+        r'sabor|flavor|taste',
+        r'kitchen|cozinha'
+    ],
+    ExpenseCategory.HEALTH: [
+        r'saude|health|medical',
+        r'clinica|clinic',
+        r'laboratorio|laboratory',
+        r'medicina|medicine',
+        r'terapia|therapy',
+        r'bem.estar|wellness',
+        r'cuidados|care'
+    ],
+    ExpenseCategory.ENTERTAINMENT: [
+        r'entretenimento|entertainment',
+        r'diversao|fun',
+        r'lazer|leisure',
+        r'cultura|culture',
+        r'arte|art',
+        r'musica|music',
+        r'video|filme|movie',
+        r'show|concert|evento',
+        r'club|clube',
+        r'streaming|media'
+    ]
+}
+
+# Compiled once: one alternation per category, tried in the order above. The
+# patterns are lowercase and only ever see lowercased text, so they are
+# matched case-sensitively
+_ENHANCED_REGEXES = [
+    (category, re.compile('|'.join(f'(?:{pattern})' for pattern in patterns)))
+    for category, patterns in _ENHANCED_PATTERNS.items()
+]
+
+# Substrings behind the large-amount and fallback heuristics; a search
+# matches anywhere in the text, the same as checking each word with `in`
+_RENT_WORDS_RE = re.compile(r'imovel|aluguel|rent')
+_TUITION_WORDS_RE = re.compile(r'escola|faculdade|university')
+_PROCESSOR_WORDS_RE = re.compile(r'ec|mp|ifd|dl')
+_BILL_WORDS_RE = re.compile(r'pagamento|taxa|conta|servico')
+_DIGITAL_MARKERS_RE = re.compile(r'[.@]|www')
+_COMPANY_SUFFIXES_RE = re.compile(r'ltda|me|eireli|sa')
+
+def _split_alternatives(pattern: str) -> List[str]:
+    """Split a pattern on its top-level '|', leaving groups and classes intact"""
+    alternatives = []
+    depth = 0
+    start = 0
+    escaped = False
+    in_class = False
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+    alternatives.append(pattern[start:])
+    return alternatives
+
 
 class ExpenseCategorizer:
     def __init__(self):
@@ -128,48 +246,118 @@ class ExpenseCategorizer:
             ]
         }
         
-        # Compile patterns for efficiency
-        self.compiled_patterns = {
-            category: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
-            for category, patterns in self.category_patterns.items()
-        }
+        # Plain-keyword alternatives from every pattern go into one Aho-Corasick
+        # automaton that finds all of them in a single pass over the merchant;
+        # only alternatives using regex features are still matched with re.
+        # Merchants are lowercased before matching and the patterns are
+        # lowercase, so neither needs case-insensitive matching
+        self.categories = list(self.category_patterns)
+        self.pattern_categories = []  # pattern id -> category
+        self.residual_patterns = []  # (pattern id, regex of its non-keyword alternatives)
+        self.residual_regexes = []  # (category priority, category, regex), in category order
+        keyword_patterns = {}
+        for priority, (category, patterns) in enumerate(self.category_patterns.items()):
+            category_residuals = []
+            for pattern in patterns:
+                pattern_id = len(self.pattern_categories)
+                self.pattern_categories.append(category)
+                residual = []
+                for alternative in _split_alternatives(pattern):
+                    if _REGEX_META.search(alternative):
+                        residual.append(alternative)
+                    else:
+                        keyword_patterns.setdefault(alternative.lower(), []).append((priority, pattern_id))
+                if residual:
+                    regex = '|'.join(residual)
+                    self.residual_patterns.append((pattern_id, re.compile(regex)))
+                    category_residuals.append(f'(?:{regex})')
+            if category_residuals:
+                self.residual_regexes.append(
+                    (priority, category, re.compile('|'.join(category_residuals)))
+                )
+        
+        # Each keyword maps to its best category priority and the patterns it belongs to
+        self.keyword_automaton = ahocorasick.Automaton()
+        for keyword, hits in keyword_patterns.items():
+            self.keyword_automaton.add_word(
+                keyword, (min(priority for priority, _ in hits), tuple(pattern_id for _, pattern_id in hits))
+            )
+        self.keyword_automaton.make_automaton()
+        
+        # Merchants that are exactly a keyword resolve with a dict lookup holding the full matcher's answer
+        self.exact_categories = {keyword: self._match_patterns(keyword, False) for keyword in keyword_patterns}
+        
+        # Merchants repeat across rows and invoices; only the amount ranges the
+        # rules look at are part of the key, so repeats skip the matching
+        self._match_rules = lru_cache(maxsize=4096)(self._match_rules)
+        self._match_enhanced = lru_cache(maxsize=4096)(self._match_enhanced)
     
-    def categorize_by_rules(self, merchant: str, amount: float) -> ExpenseCategory:
-        """Categorize expense using rule-based approach"""
-        merchant_lower = merchant.lower()
+    def categorize_batch(self, merchants: Sequence[str], amounts: Sequence[float]) -> List[ExpenseCategory]:
+        """Categorize many expenses at once; same result as categorize_by_rules per row"""
+        # Invoices repeat merchants heavily, so each distinct merchant (and
+        # whether its amount triggers the large-amount rules) is matched once
+        keys = [(merchant.lower(), amount > 1000) for merchant, amount in zip(merchants, amounts)]
+        categories = {key: self._match_rules(*key) for key in set(keys)}
+        return [categories[key] for key in keys]
+    
+    def _match_rules(self, merchant_lower: str, is_large: bool) -> ExpenseCategory:
+        """Exact keyword lookup, falling back to the full pattern match"""
+        category = self.exact_categories.get(merchant_lower)
+        if category is not None:
+            return category
         
-        # Check each category's patterns
-        for category, patterns in self.compiled_patterns.items():
-            for pattern in patterns:
-                if pattern.search(merchant_lower):
-                    return category
+        return self._match_patterns(merchant_lower, is_large)
+    
+    def _match_patterns(self, merchant_lower: str, is_large: bool) -> ExpenseCategory:
+        """First category whose patterns match, then the large-amount special cases"""
+        # Earliest category with a keyword in the merchant; a category before
+        # it can still win through its regex-only alternatives
+        best = min(
+            (priority for _, (priority, _) in self.keyword_automaton.iter(merchant_lower)),
+            default=len(self.categories)
+        )
+        for priority, category, regex in self.residual_regexes:
+            if priority >= best:
+                break
+            if regex.search(merchant_lower):
+                return category
+        if best < len(self.categories):
+            return self.categories[best]
         
-        # Special cases based on amount
-        if amount > 1000:
-            # Large amounts might be rent, tuition, etc.
-            if any(word in merchant_lower for word in ['imovel', 'aluguel', 'rent']):
+        # Large amounts might be rent, tuition, etc.
+        if is_large:
+            if _RENT_WORDS_RE.search(merchant_lower):
                 return ExpenseCategory.UTILITIES
-            elif any(word in merchant_lower for word in ['escola', 'faculdade', 'university']):
+            elif _TUITION_WORDS_RE.search(merchant_lower):
                 return ExpenseCategory.EDUCATION
         
         return ExpenseCategory.OTHER
     
+    def categorize_by_rules(self, merchant: str, amount: float) -> ExpenseCategory:
+        """Categorize expense using rule-based approach"""
+        return self._match_rules(merchant.lower(), amount > 1000)
+    
     def get_category_suggestions(self, merchant: str) -> List[ExpenseCategory]:
         """Get multiple category suggestions for a merchant"""
-        suggestions = []
         merchant_lower = merchant.lower()
         
-        # Check each category's patterns and score matches
-        for category, patterns in self.compiled_patterns.items():
-            matches = sum(1 for pattern in patterns if pattern.search(merchant_lower))
-            if matches > 0:
-                suggestions.append((category, matches))
+        # Patterns matched through any of their keywords or regex alternatives
+        matched = {
+            pattern_id
+            for _, (_, pattern_ids) in self.keyword_automaton.iter(merchant_lower)
+            for pattern_id in pattern_ids
+        }
+        matched.update(
+            pattern_id for pattern_id, regex in self.residual_patterns
+            if pattern_id not in matched and regex.search(merchant_lower)
+        )
         
-        # Sort by number of matches
-        suggestions.sort(key=lambda x: x[1], reverse=True)
+        # Score each category by its number of matching patterns
+        matches = Counter(self.pattern_categories[pattern_id] for pattern_id in matched)
+        suggestions = [(category, matches[category]) for category in self.categories if matches[category]]
         
-        # Return top 3 suggestions
-        return [cat for cat, _ in suggestions[:3]]
+        # Return top 3 suggestions by number of matches
+        return [cat for cat, _ in heapq.nlargest(3, suggestions, key=itemgetter(1))]
     
     def analyze_merchant_keywords(self, merchant: str) -> Dict[str, List[str]]:
         """Extract keywords from merchant name for better categorization"""
@@ -199,109 +387,55 @@ class ExpenseCategorizer:
     
     def categorize_with_enhanced_rules(self, merchant: str, amount: float, description: Optional[str] = None) -> ExpenseCategory:
         """Enhanced rule-based categorization with better pattern matching"""
-        merchant_lower = merchant.lower()
-        description_lower = (description or '').lower()
-        combined_text = f"{merchant_lower} {description_lower}".strip()
+        return self._match_enhanced(
+            merchant.lower(),
+            description.lower() if description else '',
+            amount < 10,
+            50 <= amount <= 200,
+            amount > 500,
+            amount > 1000
+        )
+    
+    def _match_enhanced(self, merchant_lower: str, description_lower: str, is_small: bool, is_medium: bool, is_large: bool, is_very_large: bool) -> ExpenseCategory:
+        """Standard rules, then the enhanced patterns and amount heuristics"""
+        # No description is the common case; the merchant alone is searched
+        # then (the patterns contain no whitespace, so stripping is moot)
+        combined_text = f"{merchant_lower} {description_lower}" if description_lower else merchant_lower
         
         # First try standard rules
-        category = self.categorize_by_rules(merchant, amount)
+        category = self._match_rules(merchant_lower, is_very_large)
         if category != ExpenseCategory.OTHER:
             return category
         
-        # Enhanced rules for common Brazilian merchants and patterns
-        enhanced_patterns = {
-            ExpenseCategory.UTILITIES: [
-                r'subscription|assinatura',
-                r'taxa|fee|tarifa',
-                r'conta|bill',
-                r'pagamento|payment',
-                r'mensalidade|monthly',
-                r'anuidade|annual',
-                r'\.ai|\.com|digital',
-                r'servicos|services',
-                r'tecnologia|technology',
-                r'software|app',
-                r'cloud|storage'
-            ],
-            ExpenseCategory.SHOPPING: [
-                r'loja|store',
-                r'comercio|commerce',
-                r'varejo|retail',
-                r'produtos|products',
-                r'vendas|sales',
-                r'atacado|wholesale',
-                r'importacao|import',
-                r'distribuidora|distributor',
-                r'representacoes|representatives'
-            ],
-            ExpenseCategory.TRANSPORT: [
-                r'transporte|transport',
-                r'viagem|travel|trip',
-                r'carro|car|auto',
-                r'moto|motorcycle',
-                r'bike|bicicleta',
-                r'logistica|logistics',
-                r'entrega|delivery'
-            ],
-            ExpenseCategory.FOOD: [
-                r'alimento|food',
-                r'bebida|drink|beverage',
-                r'gourmet|delicatessen',
-                r'culinaria|culinary',
-                r'gastronomia|gastronomy',
-                r'sabor|flavor|taste',
-                r'kitchen|cozinha'
-            ],
-            ExpenseCategory.HEALTH: [
-                r'saude|health|medical',
-                r'clinica|clinic',
-                r'laboratorio|laboratory',
-                r'medicina|medicine',
-                r'terapia|therapy',
-                r'bem.estar|wellness',
-                r'cuidados|care'
-            ],
-            ExpenseCategory.ENTERTAINMENT: [
-                r'entretenimento|entertainment',
-                r'diversao|fun',
-                r'lazer|leisure',
-                r'cultura|culture',
-                r'arte|art',
-                r'musica|music',
-                r'video|filme|movie',
-                r'show|concert|evento',
-                r'club|clube',
-                r'streaming|media'
-            ]
-        }
-        
         # Check enhanced patterns
-        for category_enum, patterns in enhanced_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, combined_text, re.IGNORECASE):
-                    return category_enum
+        for category_enum, regex in _ENHANCED_REGEXES:
+            if regex.search(combined_text):
+                return category_enum
         
         # Amount-based heuristics for remaining cases
-        if amount < 10:
+        if is_small:
             # Very small amounts - likely snacks, parking, or small purchases
-            if any(word in combined_text for word in ['ec', 'mp', 'ifd', 'dl']):
+            if _PROCESSOR_WORDS_RE.search(combined_text):
                 return ExpenseCategory.FOOD  # Often food purchases via payment processors
             return ExpenseCategory.TRANSPORT  # Parking, tolls, etc.
-        elif amount > 500:
+        elif is_large:
             # Large amounts - likely utilities, rent, or major shopping
-            if any(word in combined_text for word in ['pagamento', 'taxa', 'conta', 'servico']):
+            if _BILL_WORDS_RE.search(combined_text):
                 return ExpenseCategory.UTILITIES
             return ExpenseCategory.SHOPPING
-        elif 50 <= amount <= 200:
+        elif is_medium:
             # Medium amounts - could be various categories, lean towards shopping
             return ExpenseCategory.SHOPPING
         
         # Default fallback - try to guess based on merchant structure
-        if any(char in merchant_lower for char in ['.', '@', 'www']):
+        if _DIGITAL_MARKERS_RE.search(merchant_lower):
             return ExpenseCategory.UTILITIES  # Digital services
         elif merchant_lower.isupper() and len(merchant_lower.split()) == 1:
             return ExpenseCategory.SHOPPING  # Often store codes
-        elif any(word in merchant_lower for word in ['ltda', 'me', 'eireli', 'sa']):
+        elif _COMPANY_SUFFIXES_RE.search(merchant_lower):
             return ExpenseCategory.SHOPPING  # Company suffixes
         
-        return ExpenseCategory.OTHER
\ No newline at end of file
+        return ExpenseCategory.OTHER
+
+
+expense_categorizer = ExpenseCategorizer()
@@ -1,15 +1,27 @@
 from typing import Optional, Dict, Any
+from urllib.parse import urlencode
+import time
 import httpx
-from google.auth.transport import requests
-from google.oauth2 import id_token
+from google.auth import jwt
 from app.core.config import settings
 
+# Google's public keys for ID token signatures, keyed by key id
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
 
 class GoogleOAuthService:
     def __init__(self):
         self.client_id = settings.GOOGLE_CLIENT_ID
         self.client_secret = settings.GOOGLE_CLIENT_SECRET
         self.redirect_uri = settings.GOOGLE_REDIRECT_URI
+        # One pooled client for all calls, so logins reuse open connections to
+        # Google instead of paying DNS, TCP and TLS setup every time
+        self.http_client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        self._certs: Optional[Dict[str, str]] = None
+        self._certs_expire_at = 0.0
         
     def get_authorization_url(self, state: str = None) -> str:
         """Generate Google OAuth authorization URL"""
@@ -26,8 +38,8 @@ class GoogleOAuthService:
         if state:
             params["state"] = state
             
-        param_string = "&".join([f"{k}={v}" for k, v in params.items()])
-        return f"{base_url}?{param_string}"
+        # Values such as redirect_uri and state must be percent-encoded
+        return f"{base_url}?{urlencode(params)}"
     
     async def exchange_code_for_token(self, code: str) -> Dict[str, Any]:
         """Exchange authorization code for access token"""
@@ -41,20 +53,28 @@ class GoogleOAuthService:
             "redirect_uri": self.redirect_uri,
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=data)
+        response = await self.http_client.post(token_url, data=data)
+        response.raise_for_status()
+        return response.json()
+    
+    async def get_certs(self, refresh: bool = False) -> Dict[str, str]:
+        """Google's signing certificates, fetched once and reused until they expire"""
+        if refresh or self._certs is None or time.monotonic() >= self._certs_expire_at:
+            response = await self.http_client.get(GOOGLE_CERTS_URL)
             response.raise_for_status()
-            return response.json()
+            self._certs = response.json()
+            self._certs_expire_at = time.monotonic() + settings.GOOGLE_CERTS_TTL_SECONDS
+        return self._certs
     
     async def verify_id_token(self, id_token_str: str) -> Dict[str, Any]:
         """Verify Google ID token and extract user info"""
         try:
-            # Verify the token
-            idinfo = id_token.verify_oauth2_token(
-                id_token_str, 
-                requests.Request(), 
-                self.client_id
-            )
+            # Verify the token against the cached certificates; an unknown key
+            # id means Google rotated its keys, so those are fetched again
+            certs = await self.get_certs()
+            if jwt.decode_header(id_token_str).get('kid') not in certs:
+                certs = await self.get_certs(refresh=True)
+            idinfo = jwt.decode(id_token_str, certs=certs, audience=self.client_id)
             
             # Check issuer
             if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
@@ -77,10 +97,13 @@ class GoogleOAuthService:
         
         headers = {"Authorization": f"Bearer {access_token}"}
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(user_info_url, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        response = await self.http_client.get(user_info_url, headers=headers)
+        response.raise_for_status()
+        return response.json()
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP connections"""
+        await self.http_client.aclose()
 
 
 google_oauth = GoogleOAuthService()
\ No newline at end of file
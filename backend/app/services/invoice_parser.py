@@ -1,9 +1,47 @@
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional
 from datetime import datetime
+import ahocorasick
 import re
 from pathlib import Path
 
+# Columns an invoice CSV must have: date, merchant description and amount
+_INVOICE_COLUMNS = ('data', 'lançamento', 'valor')
+
+# Payment processor prefixes removed from merchant names, in this order
+_MERCHANT_PREFIXES = ('IFD*', 'MP*', 'EC *', 'DL *')
+
+# Trailing installment ("3/10") and plain numbers
+_INSTALLMENT_SUFFIX_RE = re.compile(r'\s+\d+/\d+$')
+_NUMBER_SUFFIX_RE = re.compile(r'\s+\d+$')
+
+# Standardize known merchants
+_MERCHANT_MAPPING = {
+    'AMAZONMKTPLC': 'Amazon Marketplace',
+    'AMAZON BR': 'Amazon Brasil',
+    'MERCADOPAGO': 'Mercado Pago',
+    'MERCADOLIVRE': 'Mercado Livre',
+    'UBER* TRIP': 'Uber',
+    'MC DONALDS': 'McDonald\'s',
+    'CLAUDE.AI SUBSCRIPTION': 'Claude AI',
+    'APPLE.COM/BILL': 'Apple',
+    'Paramount+': 'Paramount Plus',
+    'AmazonPrimeBR': 'Amazon Prime',
+    'Google One': 'Google One',
+}
+
+
+def _build_merchant_automaton() -> ahocorasick.Automaton:
+    """Find all mapping keys in one pass; each carries its position in the mapping"""
+    automaton = ahocorasick.Automaton()
+    for order, (pattern, replacement) in enumerate(_MERCHANT_MAPPING.items()):
+        automaton.add_word(pattern, (order, replacement))
+    automaton.make_automaton()
+    return automaton
+
+
+_MERCHANT_AUTOMATON = _build_merchant_automaton()
+
 
 class InvoiceParser:
     def __init__(self):
@@ -11,51 +49,60 @@ class InvoiceParser:
         
     def parse_csv_invoice(self, file_path: str) -> List[Dict[str, Any]]:
         """Parse CSV invoice file and extract expenses"""
+        return [expense for chunk in self.stream_csv_invoice(file_path) for expense in chunk]
+    
+    def stream_csv_invoice(self, file_path: str, chunk_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+        """Parse CSV invoice file in chunks of rows, so only one chunk is held in memory"""
         try:
-            # Read CSV file
-            df = pd.read_csv(file_path)
-            
-            # Standardize column names
-            df.columns = df.columns.str.lower().str.strip()
-            
-            # Expected columns: data, lançamento (merchant), valor (amount)
-            if not all(col in df.columns for col in ['data', 'lançamento', 'valor']):
-                raise ValueError("CSV must contain columns: data, lançamento, valor")
-            
-            expenses = []
-            
-            for _, row in df.iterrows():
-                # Skip empty rows
-                if pd.isna(row['valor']) or pd.isna(row['lançamento']):
-                    continue
+            # Read CSV file; other columns are skipped by the reader rather
+            # than materialized as Python strings and dropped
+            for df in pd.read_csv(
+                file_path,
+                chunksize=chunk_size,
+                usecols=lambda column: column.lower().strip() in _INVOICE_COLUMNS
+            ):
+                # Standardize column names
+                df.columns = df.columns.str.lower().str.strip()
+                
+                # Expected columns: data, lançamento (merchant), valor (amount)
+                if not all(col in df.columns for col in _INVOICE_COLUMNS):
+                    raise ValueError("CSV must contain columns: data, lançamento, valor")
                 
-                # Parse date
-                try:
-                    date = pd.to_datetime(row['data']).to_pydatetime()
-                except:
-                    continue
+                # Whole columns are converted at once instead of row by row;
+                # rows without an amount, a description or a parseable date
+                # are skipped. A blank date used to come through as NaT and
+                # fail on insert, so those rows are now dropped as well
+                dates = pd.to_datetime(df['data'], format='mixed', errors='coerce')
+                df = df[df['valor'].notna() & df['lançamento'].notna() & dates.notna()]
                 
-                # Parse amount (handle negative values for refunds)
-                amount = float(row['valor'])
+                # Keep negative amounts as negative (refunds)
+                amounts = df['valor'].astype(float).tolist()
+                descriptions = df['lançamento'].astype(str).tolist()
                 
-                # Clean merchant name
-                merchant = self._clean_merchant_name(str(row['lançamento']))
+                # Merchants repeat heavily, so each distinct name is cleaned once
+                merchants = {description: self._clean_merchant_name(description) for description in set(descriptions)}
                 
-                expense = {
-                    'date': date,
-                    'merchant': merchant,
-                    'amount': amount,  # Keep negative amounts as negative
-                    'is_refund': amount < 0,
-                    'original_description': str(row['lançamento']),
-                    'metadata': {
-                        'source': 'csv_import',
-                        'row_index': _
+                expenses = [
+                    {
+                        'date': date,
+                        'merchant': merchants[description],
+                        'amount': amount,
+                        'is_refund': amount < 0,
+                        'original_description': description,
+                        'metadata': {
+                            'source': 'csv_import',
+                            'row_index': row_index
+                        }
                     }
-                }
+                    for row_index, date, description, amount in zip(
+                        df.index.tolist(),
+                        dates[df.index].dt.to_pydatetime(),
+                        descriptions,
+                        amounts
+                    )
+                ]
                 
-                expenses.append(expense)
-            
-            return expenses
+                yield expenses
             
         except Exception as e:
             raise Exception(f"Failed to parse CSV invoice: {str(e)}")
@@ -63,58 +110,68 @@ class InvoiceParser:
     def _clean_merchant_name(self, merchant: str) -> str:
         """Clean and standardize merchant names"""
         # Remove common prefixes
-        prefixes_to_remove = ['IFD*', 'MP*', 'EC *', 'DL *']
-        for prefix in prefixes_to_remove:
+        for prefix in _MERCHANT_PREFIXES:
             if merchant.startswith(prefix):
                 merchant = merchant[len(prefix):]
         
         # Remove trailing numbers and special characters
-        merchant = re.sub(r'\s+\d+/\d+$', '', merchant)
-        merchant = re.sub(r'\s+\d+$', '', merchant)
-        
-        # Standardize known merchants
-        merchant_mapping = {
-            'AMAZONMKTPLC': 'Amazon Marketplace',
-            'AMAZON BR': 'Amazon Brasil',
-            'MERCADOPAGO': 'Mercado Pago',
-            'MERCADOLIVRE': 'Mercado Livre',
-            'UBER* TRIP': 'Uber',
-            'MC DONALDS': 'McDonald\'s',
-            'CLAUDE.AI SUBSCRIPTION': 'Claude AI',
-            'APPLE.COM/BILL': 'Apple',
-            'Paramount+': 'Paramount Plus',
-            'AmazonPrimeBR': 'Amazon Prime',
-            'Google One': 'Google One',
-        }
+        merchant = _INSTALLMENT_SUFFIX_RE.sub('', merchant)
+        merchant = _NUMBER_SUFFIX_RE.sub('', merchant)
         
-        for pattern, replacement in merchant_mapping.items():
-            if pattern in merchant.upper():
-                return replacement
+        # Standardize known merchants; the earliest key in the mapping wins
+        matches = [match for _, match in _MERCHANT_AUTOMATON.iter(merchant.upper())]
+        if matches:
+            return min(matches)[1]
         
         # Title case and trim
         return merchant.strip().title()
     
     def validate_expenses(self, expenses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Validate and clean parsed expenses"""
-        valid_expenses = []
-        
-        for expense in expenses:
-            # Skip zero amounts
-            if expense['amount'] == 0:
-                continue
-            
-            # Skip future dates
-            if expense['date'] > datetime.now():
-                continue
-            
-            # Add to valid expenses
-            valid_expenses.append(expense)
-        
-        return valid_expenses
+        # Skip zero amounts and future dates; the clock is read once per batch
+        now = datetime.now()
+        return [
+            expense for expense in expenses
+            if expense['amount'] != 0 and expense['date'] <= now
+        ]
     
     def get_summary(self, expenses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Get summary statistics from parsed expenses"""
-        if not expenses:
+        summary = InvoiceSummary()
+        summary.add(expenses)
+        return summary.to_dict()
+
+
+class InvoiceSummary:
+    """Summary statistics accumulated over expenses added in chunks"""
+    
+    def __init__(self):
+        self.total_expenses = 0
+        self.total_amount = 0
+        self.refund_count = 0
+        self.refund_amount = 0
+        self.start_date: Optional[datetime] = None
+        self.end_date: Optional[datetime] = None
+        self.merchants = set()
+    
+    def add(self, expenses: List[Dict[str, Any]]) -> None:
+        for e in expenses:
+            if e.get('is_refund'):
+                self.refund_count += 1
+                self.refund_amount += e['amount']
+            else:
+                self.total_expenses += 1
+                self.total_amount += e['amount']
+            
+            if self.start_date is None or e['date'] < self.start_date:
+                self.start_date = e['date']
+            if self.end_date is None or e['date'] > self.end_date:
+                self.end_date = e['date']
+            
+            self.merchants.add(e['merchant'])
+    
+    def to_dict(self) -> Dict[str, Any]:
+        if self.start_date is None:
             return {
                 'total_expenses': 0,
                 'total_amount': 0,
@@ -123,19 +180,14 @@ class InvoiceParser:
                 'date_range': None
             }
         
-        total_amount = sum(e['amount'] for e in expenses if not e.get('is_refund'))
-        refund_amount = sum(e['amount'] for e in expenses if e.get('is_refund'))
-        
-        dates = [e['date'] for e in expenses]
-        
         return {
-            'total_expenses': len([e for e in expenses if not e.get('is_refund')]),
-            'total_amount': round(total_amount, 2),
-            'refund_count': len([e for e in expenses if e.get('is_refund')]),
-            'refund_amount': round(refund_amount, 2),
+            'total_expenses': self.total_expenses,
+            'total_amount': round(self.total_amount, 2),
+            'refund_count': self.refund_count,
+            'refund_amount': round(self.refund_amount, 2),
             'date_range': {
-                'start': min(dates).isoformat(),
-                'end': max(dates).isoformat()
+                'start': self.start_date.isoformat(),
+                'end': self.end_date.isoformat()
             },
-            'unique_merchants': len(set(e['merchant'] for e in expenses))
-        }
\ No newline at end of file
+            'unique_merchants': len(self.merchants)
+        }
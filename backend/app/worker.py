@@ -0,0 +1,137 @@
+from contextlib import suppress
+from datetime import datetime
+from functools import lru_cache
+import asyncio
+import logging
+import redis
+from celery import Celery
+from sqlalchemy import insert, text
+from app.core.ai_client import ai_client
+from app.core.cache import cache
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.invoice import Invoice, InvoiceStatus
+from app.models.expense import Expense
+from app.models.expense_monthly import REFRESH_EXPENSE_MONTHLY
+from app.services.invoice_parser import InvoiceParser
+from app.services.expense_categorizer import expense_categorizer
+
+# Run with: celery -A app.worker worker --concurrency=N
+celery_app = Celery("spendtrack", broker=settings.REDIS_URL)
+
+logger = logging.getLogger(__name__)
+
+# Set while a monthly view refresh is queued, so a burst of writes shares one
+refresh_flags = redis.Redis.from_url(settings.REDIS_URL)
+EXPENSE_MONTHLY_REFRESH_KEY = "analytics:expense-monthly:refresh-pending"
+
+
+@lru_cache(maxsize=None)
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """One event loop per worker process, so the shared AI client stays bound to a live loop"""
+    return asyncio.new_event_loop()
+
+
+@celery_app.task(name="analytics.refresh_expense_monthly")
+def refresh_expense_monthly() -> None:
+    """Rebuild the monthly aggregate view read by trends and predictions"""
+    # Cleared first, so writes from here on queue another refresh
+    refresh_flags.delete(EXPENSE_MONTHLY_REFRESH_KEY)
+    with SessionLocal() as db:
+        db.execute(text(REFRESH_EXPENSE_MONTHLY))
+        db.commit()
+
+
+async def schedule_expense_monthly_refresh() -> None:
+    """Queue a refresh of the monthly view after expenses change, unless one is already queued"""
+    delay = settings.EXPENSE_MONTHLY_REFRESH_DELAY_SECONDS
+    try:
+        # The flag also expires on its own in case the queued task is lost
+        if not await cache.redis.set(EXPENSE_MONTHLY_REFRESH_KEY, 1, nx=True, ex=delay * 10):
+            return
+    except Exception:
+        logger.exception("Monthly view refresh scheduling failed")
+        return
+    
+    try:
+        # Publishing is blocking I/O that kombu retries, so keep it off the event loop
+        await asyncio.to_thread(refresh_expense_monthly.apply_async, countdown=delay)
+    except Exception:
+        logger.exception("Monthly view refresh scheduling failed")
+        # Let the next write try again rather than wait for the flag to expire
+        with suppress(Exception):
+            await cache.redis.delete(EXPENSE_MONTHLY_REFRESH_KEY)
+
+
+@celery_app.task(name="invoices.process")
+def process_invoice(invoice_id: int) -> None:
+    """Parse, categorize and store the expenses of an uploaded invoice"""
+    get_worker_loop().run_until_complete(process_invoice_task(invoice_id))
+
+
+async def process_invoice_task(invoice_id: int) -> None:
+    with SessionLocal() as db:
+        invoice = db.get(Invoice, invoice_id)
+        if not invoice:
+            return
+        
+        try:
+            # Update status
+            invoice.status = InvoiceStatus.PROCESSING
+            db.commit()
+            
+            # Parse and validate the uploaded file
+            parser = InvoiceParser()
+            raw_expenses = parser.parse_csv_invoice(invoice.file_path)
+            valid_expenses = parser.validate_expenses(raw_expenses)
+            
+            # Categorize expenses
+            categories = expense_categorizer.categorize_batch(
+                [expense_data['merchant'] for expense_data in valid_expenses],
+                [expense_data['amount'] for expense_data in valid_expenses]
+            )
+            
+            # AI categorization in batched requests rather than one per row;
+            # the client splits large invoices into concurrent sub-batches
+            ai_categories = await ai_client.categorize_expenses_batch([
+                {
+                    'id': i,
+                    'merchant': expense_data['merchant'],
+                    'amount': expense_data['amount'],
+                    'description': expense_data.get('original_description') or ''
+                }
+                for i, expense_data in enumerate(valid_expenses)
+            ])
+            
+            # Insert all expense records in one bulk statement, falling back to
+            # the rule category for rows the AI didn't categorize
+            if valid_expenses:
+                db.execute(insert(Expense), [
+                    {
+                        "user_id": invoice.user_id,
+                        "invoice_id": invoice.id,
+                        "date": expense_data['date'],
+                        "merchant": expense_data['merchant'],
+                        "amount": expense_data['amount'],
+                        "category": category,
+                        "ai_category": ai_categories.get(i, category),
+                        "description": expense_data.get('original_description'),
+                        "expense_metadata": expense_data.get('metadata')
+                    }
+                    for i, (expense_data, category) in enumerate(zip(valid_expenses, categories))
+                ])
+            
+            # Update invoice status
+            invoice.status = InvoiceStatus.PROCESSED
+            invoice.processed_at = datetime.utcnow()
+            invoice.invoice_metadata = parser.get_summary(valid_expenses)
+            
+            db.commit()
+            
+            if valid_expenses:
+                await schedule_expense_monthly_refresh()
+            
+        except Exception as e:
+            invoice.status = InvoiceStatus.FAILED
+            invoice.error_message = str(e)
+            db.commit()
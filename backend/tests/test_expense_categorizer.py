@@ -0,0 +1,148 @@
+import random
+import re
+from typing import List, Optional
+
+import pytest
+
+from app.models.expense import ExpenseCategory
+from app.services.expense_categorizer import _ENHANCED_PATTERNS, ExpenseCategorizer
+
+
+class RegexCategorizer:
+    """The original matcher: every pattern searched in category order"""
+
+    def __init__(self, category_patterns: dict):
+        self.compiled_patterns = {
+            category: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for category, patterns in category_patterns.items()
+        }
+
+    def categorize_by_rules(self, merchant: str, amount: float) -> ExpenseCategory:
+        merchant_lower = merchant.lower()
+        for category, patterns in self.compiled_patterns.items():
+            for pattern in patterns:
+                if pattern.search(merchant_lower):
+                    return category
+
+        if amount > 1000:
+            if any(word in merchant_lower for word in ['imovel', 'aluguel', 'rent']):
+                return ExpenseCategory.UTILITIES
+            elif any(word in merchant_lower for word in ['escola', 'faculdade', 'university']):
+                return ExpenseCategory.EDUCATION
+
+        return ExpenseCategory.OTHER
+
+    def get_category_suggestions(self, merchant: str) -> List[ExpenseCategory]:
+        suggestions = []
+        merchant_lower = merchant.lower()
+        for category, patterns in self.compiled_patterns.items():
+            matches = sum(1 for pattern in patterns if pattern.search(merchant_lower))
+            if matches > 0:
+                suggestions.append((category, matches))
+
+        suggestions.sort(key=lambda x: x[1], reverse=True)
+        return [cat for cat, _ in suggestions[:3]]
+
+    def categorize_with_enhanced_rules(
+        self, merchant: str, amount: float, description: Optional[str] = None
+    ) -> ExpenseCategory:
+        merchant_lower = merchant.lower()
+        description_lower = (description or '').lower()
+        combined_text = f"{merchant_lower} {description_lower}".strip()
+
+        category = self.categorize_by_rules(merchant, amount)
+        if category != ExpenseCategory.OTHER:
+            return category
+
+        for category_enum, patterns in _ENHANCED_PATTERNS.items():
+            for pattern in patterns:
+                if re.search(pattern, combined_text, re.IGNORECASE):
+                    return category_enum
+
+        if amount < 10:
+            if any(word in combined_text for word in ['ec', 'mp', 'ifd', 'dl']):
+                return ExpenseCategory.FOOD
+            return ExpenseCategory.TRANSPORT
+        elif amount > 500:
+            if any(word in combined_text for word in ['pagamento', 'taxa', 'conta', 'servico']):
+                return ExpenseCategory.UTILITIES
+            return ExpenseCategory.SHOPPING
+        elif 50 <= amount <= 200:
+            return ExpenseCategory.SHOPPING
+
+        if any(char in merchant_lower for char in ['.', '@', 'www']):
+            return ExpenseCategory.UTILITIES
+        elif merchant_lower.isupper() and len(merchant_lower.split()) == 1:
+            return ExpenseCategory.SHOPPING
+        elif any(word in merchant_lower for word in ['ltda', 'me', 'eireli', 'sa']):
+            return ExpenseCategory.SHOPPING
+
+        return ExpenseCategory.OTHER
+
+
+EXTRA_WORDS = [
+    'xpto', 'LTDA', 'imovel', 'escola', 'rent', 'car', 'Ç', 'İstanbul', 'ÇAFE', 'Padaria',
+    '  ', '', 'uber eats', 'shopping cart', 'booking', 'club card', 'gas station',
+    'rent a car', 'ifd*x', 'paramount+', '99taxi', 'abc ltda', 'www.site', 'EC*LOJA', 'Z@Y',
+]
+
+
+@pytest.fixture(scope="module")
+def categorizer() -> ExpenseCategorizer:
+    return ExpenseCategorizer()
+
+
+@pytest.fixture(scope="module")
+def reference(categorizer: ExpenseCategorizer) -> RegexCategorizer:
+    return RegexCategorizer(categorizer.category_patterns)
+
+
+@pytest.fixture(scope="module")
+def merchants(categorizer: ExpenseCategorizer) -> List[str]:
+    """Random merchants made of the patterns' own words plus some awkward extras"""
+    words = list(EXTRA_WORDS)
+    for patterns in categorizer.category_patterns.values():
+        for pattern in patterns:
+            for alternative in pattern.split('|'):
+                word = re.sub(r'\(\?!.*', '', alternative.replace(r'\s*', ' '))
+                words.append(re.sub(r'\\[bs]|[\\*?.]', ' ', word))
+
+    rng = random.Random(1)
+    merchants = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(20000)]
+    return [merchant.upper() if rng.random() < 0.3 else merchant for merchant in merchants]
+
+
+def test_rules_match_regex_scan(categorizer, reference, merchants):
+    rng = random.Random(2)
+    amounts = [rng.choice([5, 50, 1500, 2000.5]) for _ in merchants]
+
+    expected = [reference.categorize_by_rules(m, a) for m, a in zip(merchants, amounts)]
+
+    assert [categorizer.categorize_by_rules(m, a) for m, a in zip(merchants, amounts)] == expected
+    assert categorizer.categorize_batch(merchants, amounts) == expected
+
+
+def test_suggestions_match_regex_scan(categorizer, reference, merchants):
+    for merchant in merchants:
+        assert categorizer.get_category_suggestions(merchant) == reference.get_category_suggestions(merchant)
+
+
+def test_enhanced_rules_match_regex_scan(categorizer, reference, merchants):
+    rng = random.Random(3)
+    descriptions = [None, '', 'ASSINATURA mensal', 'pedido 123', 'Loja X', 'bem-estar spa', 'food court']
+    for merchant in merchants:
+        amount = rng.choice([3, 8, 30, 75, 150, 250, 800])
+        description = rng.choice(descriptions)
+        assert categorizer.categorize_with_enhanced_rules(merchant, amount, description) == \
+            reference.categorize_with_enhanced_rules(merchant, amount, description)
+
+
+def test_exact_categories_match_full_matcher(categorizer, reference):
+    assert categorizer.exact_categories
+    for keyword, category in categorizer.exact_categories.items():
+        assert reference.categorize_by_rules(keyword, 0) == category
+        assert reference.categorize_by_rules(keyword, 5000) == category
+
+
+def test_batch_handles_empty_input(categorizer):
+    assert categorizer.categorize_batch([], []) == []
@@ -0,0 +1,136 @@
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+import pytest
+
+from app.services.invoice_parser import _MERCHANT_MAPPING, InvoiceParser, InvoiceSummary
+
+NAMES = [
+    'IFD*PADARIA X 2/3', 'MP*LOJA 123', 'EC *POSTO', 'DL *UBER', 'AMAZON BR', 'uber* trip',
+    'Mc Donalds 5', 'Claude.ai subscription', 'farmacia sao joao', 'IFD*MP*DUPLO',
+    'mercadopago*xyz 01/12', '  spaced  ', 'Paramount+', 'x 12/03', 'AMAZONMKTPLC MERCADOLIVRE',
+]
+
+
+def clean_merchant_name(merchant: str) -> str:
+    """The original merchant cleaning, one regex and mapping key at a time"""
+    for prefix in ['IFD*', 'MP*', 'EC *', 'DL *']:
+        if merchant.startswith(prefix):
+            merchant = merchant[len(prefix):]
+
+    merchant = re.sub(r'\s+\d+/\d+$', '', merchant)
+    merchant = re.sub(r'\s+\d+$', '', merchant)
+
+    for pattern, replacement in _MERCHANT_MAPPING.items():
+        if pattern in merchant.upper():
+            return replacement
+
+    return merchant.strip().title()
+
+
+def parse_rows(file_path: Path, chunk_size: int) -> List[Dict[str, Any]]:
+    """The original row-by-row parse; rows whose date is blank or unparseable are skipped"""
+    expenses = []
+    for df in pd.read_csv(file_path, chunksize=chunk_size):
+        df.columns = df.columns.str.lower().str.strip()
+        for index, row in df.iterrows():
+            if pd.isna(row['valor']) or pd.isna(row['lançamento']):
+                continue
+            try:
+                date = pd.to_datetime(row['data']).to_pydatetime()
+            except (ValueError, TypeError):
+                continue
+            if pd.isna(date):
+                continue
+
+            amount = float(row['valor'])
+            expenses.append({
+                'date': date,
+                'merchant': clean_merchant_name(str(row['lançamento'])),
+                'amount': amount,
+                'is_refund': amount < 0,
+                'original_description': str(row['lançamento']),
+                'metadata': {'source': 'csv_import', 'row_index': index}
+            })
+    return expenses
+
+
+@pytest.fixture
+def invoice_csv(tmp_path: Path) -> Path:
+    rng = random.Random(3)
+    rows = ['Data,Lançamento,Valor,Parcela']
+    for _ in range(3000):
+        date = rng.choice([
+            '2024-01-%02d' % rng.randint(1, 28),
+            '%02d/%02d/2024' % (rng.randint(1, 12), rng.randint(1, 28)),
+            '2024-02-03 10:15:00',
+            '',
+            'bad-date',
+        ])
+        merchant = rng.choice(NAMES + [''])
+        amount = rng.choice(['%.2f' % rng.uniform(-50, 500), '', '0', '12'])
+        rows.append(f'{date},"{merchant}",{amount},1/1')
+
+    file_path = tmp_path / 'invoice.csv'
+    file_path.write_text('\n'.join(rows) + '\n')
+    return file_path
+
+
+@pytest.mark.parametrize('chunk_size', [7, 5000])
+def test_stream_matches_row_by_row_parse(invoice_csv, chunk_size):
+    chunks = list(InvoiceParser().stream_csv_invoice(str(invoice_csv), chunk_size=chunk_size))
+
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    assert [expense for chunk in chunks for expense in chunk] == parse_rows(invoice_csv, chunk_size)
+
+
+def test_blank_and_invalid_dates_are_skipped(tmp_path):
+    file_path = tmp_path / 'invoice.csv'
+    file_path.write_text(
+        'data,lançamento,valor\n'
+        '2024-01-05,LOJA A,10.0\n'
+        ',LOJA B,20.0\n'
+        'bad-date,LOJA C,30.0\n'
+        '2024-01-06,LOJA D,-5.0\n'
+    )
+
+    expenses = InvoiceParser().parse_csv_invoice(str(file_path))
+
+    assert [expense['merchant'] for expense in expenses] == ['Loja A', 'Loja D']
+    assert [expense['metadata']['row_index'] for expense in expenses] == [0, 3]
+
+
+def test_missing_columns_are_rejected(tmp_path):
+    file_path = tmp_path / 'invoice.csv'
+    file_path.write_text('data,valor\n2024-01-05,10.0\n')
+
+    with pytest.raises(Exception, match='CSV must contain columns'):
+        InvoiceParser().parse_csv_invoice(str(file_path))
+
+
+def test_merchant_cleaning_matches_mapping_scan():
+    parser = InvoiceParser()
+    for name in NAMES:
+        assert parser._clean_merchant_name(name) == clean_merchant_name(name)
+
+
+def test_summary_accumulates_across_chunks(invoice_csv):
+    parser = InvoiceParser()
+    summary = InvoiceSummary()
+    for chunk in parser.stream_csv_invoice(str(invoice_csv), chunk_size=100):
+        summary.add(chunk)
+
+    assert summary.to_dict() == parser.get_summary(parser.parse_csv_invoice(str(invoice_csv)))
+
+
+def test_summary_of_no_expenses():
+    assert InvoiceSummary().to_dict() == {
+        'total_expenses': 0,
+        'total_amount': 0,
+        'refund_count': 0,
+        'refund_amount': 0,
+        'date_range': None
+    }
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from app.core.worker_pool import WorkerPool
+
+
+async def test_runs_at_most_size_calls_at_once():
+    pool = WorkerPool(size=3, rate=0)
+    running = 0
+    peak = 0
+
+    async def call(value: int) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return value
+
+    results = await asyncio.gather(*(pool.run(lambda value=value: call(value)) for value in range(10)))
+
+    assert results == list(range(10))
+    assert peak == 3
+
+
+async def test_spaces_out_call_starts():
+    pool = WorkerPool(size=10, rate=50)
+    loop = asyncio.get_running_loop()
+    starts = []
+
+    async def call() -> None:
+        starts.append(loop.time())
+
+    await asyncio.gather(*(pool.run(call) for _ in range(5)))
+
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert all(gap >= 0.02 * 0.9 for gap in gaps)
+
+
+async def test_errors_release_the_slot():
+    pool = WorkerPool(size=1, rate=0)
+
+    async def fail() -> None:
+        raise ValueError("boom")
+
+    async def succeed() -> str:
+        return "ok"
+
+    with pytest.raises(ValueError):
+        await pool.run(fail)
+    assert await asyncio.wait_for(pool.run(succeed), timeout=1) == "ok"